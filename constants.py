@@ -6,8 +6,21 @@ This file is used both in the gui and console application
 GAME_SPEED = 0.3
 SAVE_FILE_TEMPLATE = 'saves/{0}.sav'
 LEVELS_DIRECTORY = 'levels'
+IMAGES_DIRECTORY = 'images'
+GUI_IMAGES = ['apple.png', 'block.png', 'brick.jpg']
 PIXEL = 15
-GUI_GAME_SPEED = 6
+GUI_FPS = 30
+GUI_TICKS_PER_SECOND = 5
+GUI_MAX_TICKS_PER_FRAME = 5
+GUI_INPUT_BUFFER_SIZE = 3
+GUI_DIRTY_RECTS = True
+GUI_TEXT_CACHE_SIZE = 64
 MAX_SAVEFILE_LEN = 10
 MIN_SAVEFILE_LEN = 3
+AUTOSAVE_NAME = 'autosave'
+AUTOSAVE_INTERVAL = 30
+CONSOLE_ESCAPE_TIMEOUT = 0.05
+SERVER_PORT = 7777
+SERVER_RESOLUTION = 0.01
+SERVER_MAX_BUFFER_SIZE = 65536
 INVALID_SAVEFILE_CHARACTERS = ['\\', '/', ':', '*', '?', '"', '<', '>', '|']
\ No newline at end of file
@@ -0,0 +1,292 @@
+"""Batch simulation of many snake games with NumPy
+
+This module is used to run large number of independent games of the same
+level in lockstep. It requires NumPy which is not needed by the rest
+of the game.
+
+"""
+
+import numpy
+from snakecore import LevelState, GameMoves
+
+NEVER = numpy.iinfo(numpy.int32).min // 2
+
+# channels of the observations
+BARRIER_CHANNEL = 0
+BODY_CHANNEL = 1
+HEAD_CHANNEL = 2
+APPLE_CHANNEL = 3
+OBSERVATION_CHANNELS = 4
+
+class LevelBatch:
+    """This class holds the states of many games of one level in NumPy
+    arrays and moves all of them with a single call. It follows the
+    same rules as Level.move.
+
+    Every maze cell remembers the tick in which the snake's head entered
+    it. A cell is part of the snake if it was entered in the last
+    snake length ticks, so the tail is moved without touching the cells.
+
+    """
+    def __init__(self, level, count, seed=None):
+        """Initialize a new batch of games
+
+        level - parsed Level used as initial state of all the games
+        count - the number of the games
+        seed - seed of the random generator used to place the apples
+
+        """
+        height = level.maze_height
+        width = level.maze_width
+        self.count = count
+        self.maze_height = height
+        self.maze_width = width
+        self.snake_max_length = level.snake_max_length
+        self.random = numpy.random.default_rng(seed)
+        self.barrier = numpy.zeros(height * width, dtype=bool)
+        for brick in level.barrier:
+            if level.is_in_maze(brick):
+                self.barrier[brick[0] * width + brick[1]] = True
+        self.entered = numpy.full((count, height * width), NEVER,
+                                  dtype=numpy.int32)
+        for i, block in enumerate(reversed(level.snake)):
+            index = block[0] * width + block[1]
+            self.entered[:, index] = i - level.snake_length + 1
+        head = level.snake[0]
+        self.ticks = numpy.zeros(count, dtype=numpy.int32)
+        self.snake_length = numpy.full(count, level.snake_length,
+                                       dtype=numpy.int32)
+        self.head_x = numpy.full(count, head[0], dtype=numpy.int32)
+        self.head_y = numpy.full(count, head[1], dtype=numpy.int32)
+        self.direction_x = numpy.full(count, level.snake_direction[0],
+                                      dtype=numpy.int32)
+        self.direction_y = numpy.full(count, level.snake_direction[1],
+                                      dtype=numpy.int32)
+        if level.apple is None:
+            apple = -1
+        else:
+            apple = level.apple[0] * width + level.apple[1]
+        self.apple = numpy.full(count, apple, dtype=numpy.int32)
+        self.states = numpy.full(count, LevelState.RUNNING, dtype=numpy.int8)
+
+    def move(self, game_moves):
+        """Change the state of all running games. Returns array with the
+        LevelState of each game after the move. The finished games are
+        not changed and their last state is returned.
+
+        game_moves - GameMoves constant or array with one per game
+
+        """
+        moves = numpy.broadcast_to(numpy.asarray(game_moves), (self.count,))
+        running = self.states == LevelState.RUNNING
+        self.__calculate_new_direction(moves, running)
+        new_x = self.head_x + self.direction_x
+        new_y = self.head_y + self.direction_y
+        outside = (new_x < 0) | (new_x >= self.maze_height) |\
+                  (new_y < 0) | (new_y >= self.maze_width)
+        cells = numpy.where(outside, 0, new_x * self.maze_width + new_y)
+        games = numpy.arange(self.count)
+        occupied = self.entered[games, cells] >\
+                   self.ticks - self.snake_length
+        lose = running & (outside | self.barrier[cells] | occupied)
+        moved = running & ~lose
+        self.states[lose] = LevelState.LOSE
+        self.ticks[moved] += 1
+        self.entered[moved, cells[moved]] = self.ticks[moved]
+        self.head_x[moved] = new_x[moved]
+        self.head_y[moved] = new_y[moved]
+        eaten = moved & (cells == self.apple)
+        self.snake_length[eaten] += 1
+        win = eaten & (self.snake_length == self.snake_max_length)
+        self.states[win] = LevelState.WIN
+        self.__move_apples(numpy.flatnonzero(eaten & ~win))
+        return self.states.copy()
+
+    def snake(self, game):
+        """Returns the snake of the game as list of tuples from the head
+        to the tail
+
+        """
+        entered = self.entered[game]
+        first = self.ticks[game] - self.snake_length[game]
+        cells = numpy.flatnonzero(entered > first)
+        cells = cells[numpy.argsort(-entered[cells], kind='stable')]
+        return [divmod(int(cell), self.maze_width) for cell in cells]
+
+    def apple_position(self, game):
+        """Returns the apple of the game as tuple or None if there is
+        no place for it
+
+        """
+        apple = int(self.apple[game])
+        if apple == -1:
+            return None
+        return divmod(apple, self.maze_width)
+
+    def observations(self, out=None):
+        """Returns uint8 array with shape (count, OBSERVATION_CHANNELS,
+        maze height, maze width) with the observations of all the games
+
+        out - optional C-contiguous array with the same shape which is
+        filled and returned
+
+        """
+        height = self.maze_height
+        width = self.maze_width
+        if out is None:
+            out = numpy.empty((self.count, OBSERVATION_CHANNELS,
+                               height, width), dtype=numpy.uint8)
+        cells = out.view()
+        cells.shape = (self.count, OBSERVATION_CHANNELS, height * width)
+        games = numpy.arange(self.count)
+        cells[:, BARRIER_CHANNEL] = self.barrier
+        cells[:, BODY_CHANNEL] = self.entered >\
+            (self.ticks - self.snake_length)[:, None]
+        cells[:, HEAD_CHANNEL] = 0
+        cells[games, HEAD_CHANNEL, self.head_x * width + self.head_y] = 1
+        cells[:, APPLE_CHANNEL] = 0
+        has_apple = self.apple != -1
+        cells[games[has_apple], APPLE_CHANNEL, self.apple[has_apple]] = 1
+        return out
+
+    def __calculate_new_direction(self, moves, running):
+        """Calculates the snake directions after the game moves
+
+        """
+        horizontal = running & (self.direction_x == 0)
+        vertical = running & ~horizontal & (self.direction_y == 0)
+        for mask, move, direction in (
+            (horizontal, GameMoves.UP, (-1, 0)),
+            (horizontal, GameMoves.DOWN, (1, 0)),
+            (vertical, GameMoves.LEFT, (0, -1)),
+            (vertical, GameMoves.RIGHT, (0, 1))):
+            selected = mask & (moves == move)
+            self.direction_x[selected] = direction[0]
+            self.direction_y[selected] = direction[1]
+
+    def __move_apples(self, games):
+        """Moves the apples of the games at random free positions.
+        The games without free cells are finished with LevelState.FULL
+
+        games - array with the indexes of the games
+
+        """
+        if len(games) == 0:
+            return
+        first = (self.ticks[games] - self.snake_length[games])[:, None]
+        free = ~(self.entered[games] > first) & ~self.barrier
+        keys = self.random.random(free.shape)
+        keys[~free] = -1
+        apples = numpy.argmax(keys, axis=1).astype(numpy.int32)
+        full = ~free.any(axis=1)
+        apples[full] = -1
+        self.apple[games] = apples
+        self.states[games[full]] = LevelState.FULL
+
+
+class ObservationEncoder:
+    """Encodes the state of a Level as uint8 array with shape
+    (OBSERVATION_CHANNELS, maze height, maze width). The channels are
+    the barrier, the snake's body, the snake's head and the apple.
+    The array is reused and after the first encoding only the cells
+    named by the level deltas are updated.
+
+    """
+    def __init__(self, level):
+        """Initialize a new encoder
+
+        level - the encoded Level
+
+        """
+        self.observation = numpy.zeros((OBSERVATION_CHANNELS,
+            level.maze_height, level.maze_width), dtype=numpy.uint8)
+        self.__level = None
+        self.__head = None
+        self.__apple = None
+        self.reset(level)
+
+    def reset(self, level):
+        """Encodes the whole level. Returns the observation
+
+        level - the encoded Level
+
+        """
+        shape = (OBSERVATION_CHANNELS, level.maze_height, level.maze_width)
+        if self.observation.shape != shape:
+            self.observation = numpy.zeros(shape, dtype=numpy.uint8)
+        _encode_level(level, self.observation)
+        self.__level = level
+        self.__head = level.snake.head
+        self.__apple = level.apple
+        return self.observation
+
+    def update(self, level, deltas):
+        """Updates the cells changed by the moves. The whole level is
+        encoded if it is not the level of the last update. Returns the
+        observation
+
+        level - the encoded Level
+        deltas - list with the LevelDelta records of the moves since
+        the last update
+
+        """
+        if level is not self.__level:
+            return self.reset(level)
+        observation = self.observation
+        cells = {self.__head}
+        for delta in deltas:
+            cells.add(delta.head)
+            if delta.tail is not None:
+                cells.add(delta.tail)
+        for cell in cells:
+            if level.is_in_maze(cell):
+                observation[BODY_CHANNEL][cell] = cell in level.snake
+        self.__set(HEAD_CHANNEL, self.__head, 0)
+        self.__head = level.snake.head
+        self.__set(HEAD_CHANNEL, self.__head, 1)
+        if level.apple != self.__apple:
+            self.__set(APPLE_CHANNEL, self.__apple, 0)
+            self.__apple = level.apple
+            self.__set(APPLE_CHANNEL, self.__apple, 1)
+        return observation
+
+    def __set(self, channel, cell, value):
+        if cell is not None and self.__level.is_in_maze(cell):
+            self.observation[channel][cell] = value
+
+
+def encode_observations(levels, out=None):
+    """Encodes many levels with the same maze size at once. Returns
+    uint8 array with shape (number of levels, OBSERVATION_CHANNELS,
+    maze height, maze width)
+
+    levels - list of Level objects
+    out - optional array with the same shape which is filled and returned
+
+    """
+    height = levels[0].maze_height
+    width = levels[0].maze_width
+    if any(level.maze_height != height or level.maze_width != width
+           for level in levels):
+        raise ValueError('The levels must have the same maze size')
+    if out is None:
+        out = numpy.empty((len(levels), OBSERVATION_CHANNELS, height, width),
+                          dtype=numpy.uint8)
+    for level, observation in zip(levels, out):
+        _encode_level(level, observation)
+    return out
+
+def _encode_level(level, observation):
+    """Encodes the whole level into the observation array
+
+    """
+    observation.fill(0)
+    for channel, cells in ((BARRIER_CHANNEL, level.barrier),
+                           (BODY_CHANNEL, level.snake)):
+        cells = numpy.array([cell for cell in cells if level.is_in_maze(cell)],
+                            dtype=numpy.intp).reshape(-1, 2)
+        observation[channel, cells[:, 0], cells[:, 1]] = 1
+    for channel, cell in ((HEAD_CHANNEL, level.snake.head),
+                          (APPLE_CHANNEL, level.apple)):
+        if cell is not None and level.is_in_maze(cell):
+            observation[channel][cell] = 1
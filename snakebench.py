@@ -0,0 +1,112 @@
+"""Benchmarks of the Snake Game library
+
+Usage: python snakebench.py
+The benchmarks use the levels from the level directory.
+
+"""
+
+import pickle, random, timeit
+from constants import *
+from snakecore import *
+
+def benchmark_saves(level_path=LEVELS_DIRECTORY, number=1000):
+    """Compares the binary save format with pickle. Returns dictionary
+    with the size in bytes and the best time in seconds for one save
+    and load of each format.
+
+    """
+    game = Game(LevelManager(level_path), seed=0)
+    for i in range(20):
+        game.move(GameMoves.PASS)
+    data = encode_snapshot(game.snapshot())
+    pickled = pickle.dumps(game)
+    return {
+        'binary size': len(data),
+        'pickle size': len(pickled),
+        'binary save': _measure(
+            lambda: encode_snapshot(game.snapshot()), number),
+        'pickle save': _measure(lambda: pickle.dumps(game), number),
+        'binary load': _measure(
+            lambda: Game.from_snapshot(decode_snapshot(data)), number),
+        'pickle load': _measure(lambda: pickle.loads(pickled), number),
+    }
+
+def _measure(function, number, repeat=5):
+    """Returns the best time in seconds for one call of the function
+
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+def benchmark_deltas(level_path=LEVELS_DIRECTORY, number=10000):
+    """Measures the level deltas sent to the spectators. The first level
+    is played by a bot until number deltas are recorded. Returns
+    dictionary with the sizes in bytes, the time in seconds for one delta
+    and the number of the deltas per second.
+
+    """
+    rng = random.Random(0)
+    level = LevelManager(level_path).load_next_level()
+    games = []
+    count = 0
+    while count < number:
+        game = level.copy(rng)
+        snapshot = encode_level_snapshot(game)
+        deltas = []
+        state = LevelState.RUNNING
+        while state == LevelState.RUNNING and count + len(deltas) < number:
+            state = game.move(_choose_move(game, rng), deltas)
+        count += len(deltas)
+        games.append((snapshot, deltas))
+    start = timeit.default_timer()
+    streams = [(snapshot, b''.join(map(encode_delta, deltas)))
+               for snapshot, deltas in games]
+    encode_time = timeit.default_timer() - start
+    start = timeit.default_timer()
+    for snapshot, data in streams:
+        LevelMirror(snapshot).feed(data)
+    apply_time = timeit.default_timer() - start
+    return {
+        'deltas': count,
+        'deltas size': sum(len(data) for snapshot, data in streams),
+        'snapshot size': len(streams[0][0]),
+        'delta encode': encode_time / count,
+        'delta apply': apply_time / count,
+        'deltas per second': int(count / apply_time),
+    }
+
+def _choose_move(level, rng):
+    """Returns random move which doesn't hit the barrier or the snake
+
+    """
+    head = level.snake.head
+    moves = []
+    for game_move, direction in ((GameMoves.UP, (-1, 0)),
+                                 (GameMoves.DOWN, (1, 0)),
+                                 (GameMoves.LEFT, (0, -1)),
+                                 (GameMoves.RIGHT, (0, 1))):
+        cell = (head[0] + direction[0], head[1] + direction[1])
+        if level.is_in_maze(cell) and cell not in level.snake\
+            and cell not in level.barrier:
+            moves.append(game_move)
+    return rng.choice(moves) if moves else GameMoves.PASS
+
+def print_results(title, results):
+    """Prints the results of a benchmark
+
+    """
+    print(title)
+    for name, value in results.items():
+        if isinstance(value, float):
+            print('    {0}: {1:.1f} us'.format(name, value * 1000000))
+        else:
+            print('    {0}: {1}'.format(name, value))
+
+def main():
+    """Main entry point
+
+    """
+    print_results('Saves', benchmark_saves())
+    print_results('Spectator deltas', benchmark_deltas())
+
+if __name__ == '__main__':
+    main()
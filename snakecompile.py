@@ -0,0 +1,70 @@
+"""Compiles text levels into the binary formats used by the Snake Game
+
+Usage: python snakecompile.py <level directory> [<output>]
+The compiled levels are written next to the text levels if output is not
+given. If the output ends with .levelpack all levels are written into
+single level pack file, otherwise the output is a directory.
+LevelManager prefers the compiled levels to the text levels unless
+the text level is modified after it is compiled.
+
+"""
+
+import os, sys
+from snakecore import *
+
+def read_levels(level_path):
+    """Reads all text levels from the level directory and returns them
+    as list
+
+    level_path - the directory with the text levels
+
+    """
+    manager = LevelManager(level_path)
+    levels = []
+    while True:
+        number = len(levels) + 1
+        filename = os.path.join(level_path, str(number) + LEVEL_EXTENSION)
+        if not os.path.exists(filename):
+            return levels
+        levels.append(manager.read_level(filename, number))
+
+def compile_levels(level_path, output_path):
+    """Compiles all levels from the level directory. Returns the number
+    of the compiled levels
+
+    level_path - the directory with the text levels
+    output_path - the directory where the compiled levels are written
+    or the path of the level pack
+
+    """
+    levels = read_levels(level_path)
+    if output_path.endswith(LEVEL_PACK_EXTENSION):
+        LevelPack.write(output_path, levels)
+        return len(levels)
+    os.makedirs(output_path, exist_ok=True)
+    for level in levels:
+        output = os.path.join(output_path,
+                              str(level.level) + COMPILED_LEVEL_EXTENSION)
+        with open(output, 'wb') as file:
+            file.write(encode_level(level))
+    return len(levels)
+
+def main():
+    """Main entry point
+
+    """
+    if len(sys.argv) not in (2, 3):
+        print(__doc__)
+        return 1
+    level_path = sys.argv[1]
+    output_path = sys.argv[2] if len(sys.argv) == 3 else level_path
+    try:
+        count = compile_levels(level_path, output_path)
+    except LevelFormatError as ex:
+        print('Incorrect level syntax: "{0}"'.format(ex))
+        return 1
+    print('{0} levels compiled into {1}'.format(count, output_path))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,11 +2,24 @@
 
 """
 
-import msvcrt, os
-from time import sleep
+import os
+from time import perf_counter, sleep
 from constants import *
 from sys import *
 from snakecore import *
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import select, termios, tty
+
+KEY_UP = 'up'
+KEY_DOWN = 'down'
+KEY_LEFT = 'left'
+KEY_RIGHT = 'right'
+KEY_ESCAPE = 'esc'
+KEY_MOVES = {KEY_UP: GameMoves.UP, KEY_DOWN: GameMoves.DOWN,
+             KEY_LEFT: GameMoves.LEFT, KEY_RIGHT: GameMoves.RIGHT}
 
 def main():
     """Main entry point
@@ -52,71 +65,302 @@ def manage_load_command(name):
             print('Save with this name does not exist')
         else:
             print('Unexpected error while loading level information')
+    except (SaveFormatError, LevelError) as ex:
+        print('The save could not be loaded: "{0}"'.format(ex))
     else:
         start_game(game)
 
 def start_game(game):
-    """Start game loop
+    """Start game loop. The keys are read until the next tick is due
+    and the pressed moves are queued, so one move is done per tick
 
     game - the Game object which will be used into the game cycle
 
     """
-    draw_level(game.current_level)
-    while True:
-        if msvcrt.kbhit():
+    renderer = TerminalRenderer(stdout)
+    input_buffer = InputBuffer()
+    with Keyboard() as keyboard:
+        try:
+            renderer.draw(game.current_level)
+            next_tick = perf_counter() + GAME_SPEED
+            while True:
+                timeout = max(next_tick - perf_counter(), 0)
+                for key in keyboard.read_keys(timeout):
+                    if key == KEY_ESCAPE:
+                        return
+                    elif key == 's':
+                        save_game(game, keyboard, renderer)
+                        renderer.draw(game.current_level)
+                    elif key in KEY_MOVES:
+                        direction = game.current_level.snake_direction
+                        input_buffer.push(KEY_MOVES[key], direction)
+                now = perf_counter()
+                if now >= next_tick:
+                    deltas = []
+                    state = game.move(input_buffer.pop(), deltas)
+                    if state != LevelState.RUNNING:
+                        input_buffer.clear()
+                    renderer.update(game.current_level, deltas)
+                    next_tick = max(next_tick + GAME_SPEED, now)
+        finally:
+            renderer.close()
+
+
+class TerminalRenderer:
+    """Draws the game on a terminal with ANSI escape sequences.
+    The maze is drawn once per level and after each tick only the
+    changed cells and the level info are written
+
+    """
+    def __init__(self, output):
+        """Initialize a new renderer
+
+        output - the text stream of the terminal
+
+        """
+        self.output = output
+        self.bytes_written = 0
+        self.__level = None
+        self.__apple = None
+        self.__info = None
+        if msvcrt is not None:
+            os.system('') # enables the escape sequences on Windows
+
+    def draw(self, level):
+        """Draws the whole game using the level object
+
+        level - the Level object which is painted
+
+        """
+        maze =[['-' for x in range(level.maze_width)]
+                    for y in range(level.maze_height)]
+        apple = level.apple
+        if apple is not None:
+            maze[apple[0]][apple[1]] = 'X'
+        for block in level.snake:
+            if level.is_in_maze(block):
+                maze[block[0]][block[1]] = 'o'
+        for brick in level.barrier:
+            maze[brick[0]][brick[1]] = '#'
+        lines = [''.join(row) for row in maze]
+        self.__info = self.__level_info(level)
+        self.__write('\x1b[?25l\x1b[2J\x1b[H' + '\n'.join(lines) +
+                     '\n\n' + self.__info)
+        self.__level = level
+        self.__apple = apple
+
+    def update(self, level, deltas):
+        """Writes only the cells changed by the deltas. The whole game is
+        drawn if the level is changed
+
+        level - the Level object which is painted
+        deltas - list with the LevelDelta records since the last update
+
+        """
+        if level is not self.__level:
+            self.draw(level)
+            return
+        cells = set()
+        for delta in deltas:
+            cells.add(delta.head)
+            if delta.tail is not None:
+                cells.add(delta.tail)
+        if level.apple != self.__apple:
+            cells.add(self.__apple)
+            cells.add(level.apple)
+            self.__apple = level.apple
+        parts = []
+        for cell in cells:
+            if cell is not None and level.is_in_maze(cell):
+                if cell in level.snake:
+                    char = 'o'
+                elif cell == level.apple:
+                    char = 'X'
+                else:
+                    char = '-'
+                parts.append(self.__move_cursor(cell[0], cell[1]) + char)
+        info = self.__level_info(level)
+        if info != self.__info:
+            parts.append(self.__move_cursor(level.maze_height + 1, 0) +
+                         info + '\x1b[K')
+            self.__info = info
+        if parts:
+            self.__write(''.join(parts))
+
+    def clear(self):
+        """Clears the terminal
+
+        """
+        self.__write('\x1b[2J\x1b[H')
+        self.__level = None
+
+    def close(self):
+        """Clears the terminal and shows the cursor
+
+        """
+        self.__write('\x1b[2J\x1b[H\x1b[?25h')
+        self.__level = None
+
+    def __level_info(self, level):
+        return 'Level: {0} Snake Length: {1}/{2}'.format(level.level,
+            level.snake_length, level.snake_max_length)
+
+    def __move_cursor(self, row, column):
+        return '\x1b[{0};{1}H'.format(row + 1, column + 1)
+
+    def __write(self, text):
+        self.output.write(text)
+        self.output.flush()
+        self.bytes_written += len(text)
+
+
+class PosixKeyboard:
+    """Reads the pressed keys from the terminal without blocking.
+    The terminal is switched to cbreak mode while the keyboard is used
+
+    """
+    ARROWS = {'A': KEY_UP, 'B': KEY_DOWN, 'C': KEY_RIGHT, 'D': KEY_LEFT}
+
+    def __init__(self, fd=None):
+        """Initialize a new keyboard
+
+        fd - the file descriptor of the terminal, the standard input
+        by default
+
+        """
+        self.fd = fd if fd is not None else stdin.fileno()
+        self.__attributes = None
+        self.__pending = ''
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        """Switches the terminal to cbreak mode
+
+        """
+        if self.__attributes is None:
+            self.__attributes = termios.tcgetattr(self.fd)
+            tty.setcbreak(self.fd)
+
+    def stop(self):
+        """Restores the terminal mode
+
+        """
+        if self.__attributes is not None:
+            termios.tcsetattr(self.fd, termios.TCSADRAIN, self.__attributes)
+            self.__attributes = None
+
+    def read_keys(self, timeout=0):
+        """Returns list with the pressed keys. It waits at most timeout
+        seconds for the first key. If the read data ends with an
+        incomplete escape sequence the rest of it is waited for
+        CONSOLE_ESCAPE_TIMEOUT seconds. A lone escape which is not
+        followed by more data is the escape key and an incomplete
+        arrow is kept until the next read
+
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = self.__pending + self.__read()
+        self.__pending = ''
+        while data.endswith('\x1b') or data.endswith('\x1b['):
+            ready, _, _ = select.select([self.fd], [], [],
+                                        CONSOLE_ESCAPE_TIMEOUT)
+            if not ready:
+                break
+            data += self.__read()
+        keys = []
+        i = 0
+        while i < len(data):
+            if data.startswith('\x1b[', i):
+                if i + 2 == len(data):
+                    self.__pending = data[i:]
+                    break
+                if data[i + 2] in self.ARROWS:
+                    keys.append(self.ARROWS[data[i + 2]])
+                i += 3
+            elif data[i] == '\x1b':
+                keys.append(KEY_ESCAPE)
+                i += 1
+            else:
+                keys.append(data[i])
+                i += 1
+        return keys
+
+    def __read(self):
+        """Reads the available data from the terminal
+
+        """
+        return os.read(self.fd, 64).decode('utf-8', 'replace')
+
+    def wait_key(self):
+        """Waits until a key is pressed
+
+        """
+        while not self.read_keys(None):
+            pass
+
+
+class WindowsKeyboard:
+    """Reads the pressed keys from the Windows console without blocking
+
+    """
+    ARROWS = {72: KEY_UP, 80: KEY_DOWN, 75: KEY_LEFT, 77: KEY_RIGHT}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def read_keys(self, timeout=0):
+        """Returns list with the pressed keys. It waits at most timeout
+        seconds for the first key
+
+        """
+        end = perf_counter() + timeout
+        while not msvcrt.kbhit() and perf_counter() < end:
+            sleep(0.005)
+        keys = []
+        while msvcrt.kbhit():
             input = ord(msvcrt.getch())
             if input == 27: # esc
-                os.system('cls')
-                return
-            elif input == 115: # s
-                os.system('cls')
-                save_game(game)
-            elif input == 224: # arrows
+                keys.append(KEY_ESCAPE)
+            elif input == 224 or input == 0: # arrows
                 input = ord(msvcrt.getch())
-                if input == 72:
-                    game.move(GameMoves.UP)
-                elif input == 80:
-                    game.move(GameMoves.DOWN)
-                elif input == 75:
-                    game.move(GameMoves.LEFT)
-                elif input == 77:
-                    game.move(GameMoves.RIGHT)
+                if input in self.ARROWS:
+                    keys.append(self.ARROWS[input])
             else:
-                game.move(GameMoves.PASS)
-        else:
-            game.move(GameMoves.PASS)
-        draw_level(game.current_level)
-        sleep(GAME_SPEED)
+                keys.append(chr(input))
+        return keys
 
-def draw_level(level):
-    """Draws the game on the console using the level object
+    def wait_key(self):
+        """Waits until a key is pressed
 
-    level - the Level object which is painted
+        """
+        msvcrt.getch()
 
-    """
-    maze =[['-' for x in range(level.maze_width)]
-                for y in range(level.maze_height)]
-    apple = level.apple
-    maze[apple[0]][apple[1]] = 'X'
-    for block in level.snake:
-        maze[block[0]][block[1]] = 'o'
-    for brick in level.barrier:
-        maze[brick[0]][brick[1]] = '#'
-    os.system('cls')
-    for row in maze:
-        line = ''.join(row)
-        print(line)
-    current_level = level.level
-    snake_len = level.snake_length
-    snake_max_len = level.snake_max_length
-    info ='\nLevel: {0} Snake Length: {1}/{2}'\
-        .format(current_level, snake_len, snake_max_len)
-    print(info)
-
-def save_game(game):
+
+Keyboard = WindowsKeyboard if msvcrt is not None else PosixKeyboard
+
+def save_game(game, keyboard, renderer):
     """Save Game object into file. The name is choosen by the user
 
     """
+    renderer.clear()
+    keyboard.stop()
     stdout.write('Enter name of the save: ')
     stdout.flush()
     name = stdin.readline()[:-1]
@@ -126,9 +370,9 @@ def save_game(game):
         print('The game is saved.', end=' ')
     except IOError:
         print('Unexpected error while saving game information.', end=' ')
-        msvcrt.getch()
     print('Press any key to continue...')
-    msvcrt.getch()
+    keyboard.start()
+    keyboard.wait_key()
 
 def print_help():
     """Prints the game help on the console
@@ -6,49 +6,175 @@ Additionaly the game state could be saved and loaded as well.
 
 """
 
-import pickle, random
+import array, hashlib, mmap, os, pickle, random, struct, sys, threading, time
+import zlib
+from collections import deque, namedtuple, Counter, OrderedDict
+from itertools import compress
+
+LEVEL_EXTENSION = '.level'
+COMPILED_LEVEL_EXTENSION = '.clevel'
+LEVEL_PACK_EXTENSION = '.levelpack'
+
+class LevelCache:
+    """Cache of the parsed levels keyed by the level file path.
+    A cached level is parsed again if its file is modified. When the
+    cache is full the least recently used level is removed.
+
+    """
+    def __init__(self, max_size=32):
+        """Initialize a new empty cache
+
+        max_size - the maximum number of cached levels
+
+        """
+        self.max_size = max_size
+        self.__levels = OrderedDict()
+
+    def __len__(self):
+        return len(self.__levels)
+
+    def get(self, path, load, key=None, mtime=None):
+        """Returns the cached level for the path. If the level is not
+        cached or the file is modified the level is loaded again.
+        IOError is raised if the file could not be accessed.
+
+        path - the path of the level file
+        load - function which parses the file and returns Level
+        key - the cache key if the file contains more than one level
+        mtime - the modification time of the file in nanoseconds if it
+        is already known
+
+        """
+        if key is None:
+            key = path
+        if mtime is None:
+            mtime = os.stat(path).st_mtime_ns
+        entry = self.__levels.get(key)
+        if entry is not None and entry[0] == mtime:
+            self.__levels.move_to_end(key)
+            return entry[1]
+        level = load(path)
+        self.__levels[key] = (mtime, level)
+        self.__levels.move_to_end(key)
+        while len(self.__levels) > self.max_size:
+            self.__levels.popitem(last=False)
+        return level
+
+    def clear(self):
+        """Removes all the cached levels
+
+        """
+        self.__levels.clear()
+
 
 class LevelManager:
     """This class is used to manage the levels.
     It is used to load all the levels from the selected level directory
-    and it keeps track of the current level.
+    or level pack and it keeps track of the current level. The parsed
+    levels are kept in a cache shared by all the managers so the levels
+    are not read from the disk when the game is reset.
 
     """
-    def __init__(self, level_path):
+    cache = LevelCache()
+
+    def __init__(self, level_path, rng=None):
         """Initialize a new instance of a LevelManager
-        level_path - the path where is the level directory
+        level_path - the path where is the level directory or the path
+        of level pack file
+        rng - random.Random instance shared by the loaded levels
 
         """
         self.current_file = 1
         self.current_level = None
         self.level_path = level_path
+        self.rng = rng if rng is not None else random.Random()
+        self.__pack = None
+
+    def __getstate__(self):
+        """The open level pack is not pickled. It is opened on first use
+
+        """
+        state = self.__dict__.copy()
+        state['_LevelManager__pack'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled level manager. The managers pickled by older
+        versions of the game don't have random generator
+
+        """
+        self.__dict__.update(state)
+        self.__pack = None
+        if 'rng' not in state:
+            if self.current_level is not None:
+                self.rng = self.current_level.rng
+            else:
+                self.rng = random.Random()
 
     def load_next_level(self):
         """Loads the next level in current_level property
         If such doesn't exist LastLevelError is raised.
 
         """
-        filename = "{0}/{1}.level".format(self.level_path, self.current_file)
-        self.current_level = Level(self.current_file)
+        number = self.current_file
         self.current_file += 1
-        try:
-            with open(filename) as file:
-                self.__read_level_properties(file)
-                maze_lines = file.readlines()
-        except IOError as ex:
-            if ex.errno == 2: # the file was not found
-                raise LastLevelError()
-            else:
-                raise LevelIOError()
-        self.__read_level_maze(maze_lines)
-        self.__read_level_snake(maze_lines)
-        if not self.__are_all_objects_in_maze(self.current_level.snake)\
-            or not self.__are_all_objects_in_maze(self.current_level.barrier):
-            raise LevelFormatError('Incorrect width or height')
-        self.current_level.move_apple()
+        self.current_level = self.__load_template(number).copy(self.rng)
+        if not self.current_level.move_apple():
+            raise LevelFormatError('There is no free cell for the apple')
         self.current_level.state = LevelState.RUNNING
         return self.current_level
 
+    def restore_level(self, number, snake, apple, snake_direction):
+        """Loads the level with the given number in the given state.
+        It is used to restore saved games so the apple is not moved.
+
+        number - the number of the level
+        snake - list of tuples with the snake blocks
+        apple - tuple with the apple or None
+        snake_direction - tuple with the direction of the snake
+
+        """
+        self.current_file = number + 1
+        level = self.__load_template(number).copy(self.rng, snake)
+        level.apple = apple
+        level.snake_direction = snake_direction
+        level.state = LevelState.RUNNING
+        self.current_level = level
+        return level
+
+    def __load_template(self, number):
+        """Returns the cached template of the level with the given number
+
+        """
+        if self.is_pack:
+            return self.__load_packed_level(number)
+        return self.__load_level_file(number)
+
+    @property
+    def is_pack(self):
+        """True if the levels are loaded from level pack file
+
+        """
+        return self.level_path.endswith(LEVEL_PACK_EXTENSION)
+
+    @property
+    def level_count(self):
+        """The number of the levels. For level packs it is read from the
+        pack's index. For level directories the files are counted.
+
+        """
+        if self.is_pack:
+            try:
+                return len(self.__get_pack())
+            except IOError:
+                raise LevelIOError()
+        number = 1
+        while any(os.path.exists("{0}/{1}{2}".format(self.level_path,
+                                                     number, extension))
+                  for extension in (COMPILED_LEVEL_EXTENSION, LEVEL_EXTENSION)):
+            number += 1
+        return number - 1
+
     def reset(self):
         """Loads the first game level
 
@@ -56,9 +182,126 @@ class LevelManager:
         self.current_file = 1
         self.load_next_level()
 
-    def __read_level_properties(self, file):
+    def __load_level_file(self, number):
+        """Returns the cached template of the level from the level
+        directory. The compiled level is used if there is such and it
+        is not older than the text level, which is the source format.
+
+        number - the number of the level
+
+        """
+        filenames = ["{0}/{1}{2}".format(self.level_path, number, extension)
+                     for extension in (COMPILED_LEVEL_EXTENSION,
+                                       LEVEL_EXTENSION)]
+        mtimes = [_get_mtime(filename) for filename in filenames]
+        if mtimes[0] is None and mtimes[1] is None:
+            raise LastLevelError()
+        elif mtimes[1] is None or\
+            (mtimes[0] is not None and mtimes[0] >= mtimes[1]):
+            filename, mtime = filenames[0], mtimes[0]
+        else:
+            filename, mtime = filenames[1], mtimes[1]
+        try:
+            return self.cache.get(filename,
+                lambda path: self.read_level(path, number), mtime=mtime)
+        except IOError as ex:
+            if ex.errno == 2: # the file was removed
+                raise LastLevelError()
+            raise LevelIOError()
+
+    def __load_packed_level(self, number):
+        """Returns the cached template of the level from the level pack
+
+        number - the number of the level
+
+        """
+        try:
+            pack = self.__get_pack()
+            if number > len(pack):
+                raise LastLevelError()
+            return self.cache.get(self.level_path,
+                lambda path: pack.read_level(number),
+                (self.level_path, number))
+        except IOError:
+            raise LevelIOError()
+
+    def __get_pack(self):
+        """Returns the level pack. It is opened again if the file is
+        modified and the old mapping is closed
+
+        """
+        mtime = os.stat(self.level_path).st_mtime_ns
+        if self.__pack is not None and self.__pack.mtime != mtime:
+            self.__pack.close()
+            self.__pack = None
+        if self.__pack is None:
+            self.__pack = LevelPack(self.level_path)
+        return self.__pack
+
+    def read_level(self, filename, number=1):
+        """Reads the level file and returns the parsed level without
+        changing the current level. The apple is not placed.
+        Compiled levels are memory-mapped, the text levels are read
+        line by line so the whole file is never loaded.
+
+        filename - the path of the level file
+        number - the number of the level
+
+        """
+        if filename.endswith(COMPILED_LEVEL_EXTENSION):
+            with open(filename, 'rb') as file:
+                try:
+                    data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError: # the file is empty
+                    raise LevelFormatError('Incorrect compiled level')
+                with data:
+                    return decode_level(data, number)
+        level = Level(number)
+        with open(filename) as file:
+            self.__read_level_properties(level, file)
+            heads, segments = self.__read_level_maze(level, file)
+        self.__read_level_snake(level, heads, segments)
+        if not self.__are_all_objects_in_maze(level, level.snake)\
+            or not self.__are_all_objects_in_maze(level, level.barrier):
+            raise LevelFormatError('Incorrect width or height')
+        return level
+
+    def read_arena(self, filename, number=1):
+        """Reads the level file as an arena and returns the parsed
+        ArenaLevel. Every '@' in the maze is the head of one snake.
+        The snakes must not touch each other in the file.
+
+        filename - the path of the text level file
+        number - the number of the level
+
+        """
+        if filename.endswith(COMPILED_LEVEL_EXTENSION):
+            raise LevelFormatError('Arenas are read only from text levels')
+        arena = ArenaLevel(number)
+        with open(filename) as file:
+            self.__read_level_properties(arena, file)
+            heads, segments = self.__read_level_maze(arena, file)
+        if not heads:
+            raise LevelFormatError('The snake head could not be found')
+        if not self.__are_all_objects_in_maze(arena, arena.barrier)\
+            or not self.__are_all_objects_in_maze(arena, heads):
+            raise LevelFormatError('Incorrect width or height')
+        for head in heads:
+            snake = _trace_snake(head, segments,
+                                 arena.maze_height, arena.maze_width)
+            if len(snake) < 2:
+                raise LevelFormatError(
+                    'Snake must be at least with two elements')
+            if not self.__are_all_objects_in_maze(arena, snake):
+                raise LevelFormatError('Incorrect width or height')
+            arena.add_snake(snake, (snake[0][0] - snake[1][0],
+                                    snake[0][1] - snake[1][1]))
+        return arena
+
+    def __read_level_properties(self, level, file):
         """Reads and validated the properties stored into the config file
 
+        level - the Level which is read
         file - open level config file
 
         """
@@ -80,92 +323,244 @@ class LevelManager:
             raise LevelFormatError('Maze width was not specified')
         elif maze_height == None:
             raise LevelFormatError('Maze height was not specified')
-        self.current_level.snake_max_length = snake_max_length
-        self.current_level.maze_width = maze_width
-        self.current_level.maze_height = maze_height
+        level.snake_max_length = snake_max_length
+        level.maze_width = maze_width
+        level.maze_height = maze_height
+
+    def __read_level_maze(self, level, lines):
+        """Reads the bricks. Returns list with the positions of the
+        snake heads and set with the positions of the other snake blocks
 
-    def __read_level_maze(self, lines):
-        """Reads the bricks and the snake's head
+        level - the Level or ArenaLevel which is read
+        lines - iterable of strings representing the maze
 
         """
+        barrier = []
+        heads = []
+        segments = set()
         for i, line in enumerate(lines):
-            for j, char in enumerate(line):
-                if char == '#':
-                    self.current_level.barrier.append((i, j))
-                elif char == '@':
-                    self.current_level.snake.append((i, j))
-        if len(self.current_level.snake) != 1:
-            raise LevelFormatError('The snake head could not be found')
+            barrier.extend((i, j) for j in _find_all(line, '#'))
+            heads.extend((i, j) for j in _find_all(line, '@'))
+            segments.update((i, j) for j in _find_all(line, '%'))
+        level.barrier = barrier
+        return heads, segments
+
+    def __read_level_snake(self, level, heads, segments):
+        """Reads the snake. The level must have exactly one head
 
-    def __read_level_snake(self, lines):
-        """Reads the snake. This function relies on that the head
-        is already founded
+        level - the Level which is read
+        heads - list with the positions of the snake heads
+        segments - set with the positions of the snake blocks which
+        are not visited yet. The visited blocks are removed from it.
 
-        lines - list of strings representing the maze
         """
-        snake = self.current_level.snake
-        height = self.current_level.maze_height
-        width = self.current_level.maze_width
-        snake_head = snake[0]
-        x, y = snake_head[0], snake_head[1]
-        while True:
-            if x > 0 and\
-                self.__is_not_visited(lines, x - 1, y):
-                x -= 1
-            elif x < height - 1 and\
-                self.__is_not_visited(lines, x + 1, y):
-                x += 1
-            elif y > 0 and\
-                self.__is_not_visited(lines, x, y - 1):
-                y -= 1
-            elif y < width - 1 and\
-                self.__is_not_visited(lines, x, y + 1):
-                y += 1
-            else:
-                break
-            snake.append((x, y))
+        if len(heads) != 1:
+            raise LevelFormatError('The snake head could not be found')
+        snake = _trace_snake(heads[0], segments,
+                             level.maze_height, level.maze_width)
         if len(snake) < 2:
             raise LevelFormatError('Snake must be at least with two elements')
+        level.snake = snake
         x_direction = snake[0][0] - snake[1][0]
         y_direction = snake[0][1] - snake[1][1]
-        self.current_level.snake_direction = (x_direction, y_direction)
+        level.snake_direction = (x_direction, y_direction)
 
-    def __are_all_objects_in_maze(self, objects):
+    def __are_all_objects_in_maze(self, level, objects):
         """Checks if all objects are in the bounds of the maze
 
+        level - the Level which is read
         objects - list of tuples
 
         """
-        return any(item[0] < self.current_level.maze_height or\
-                   item[1] < self.current_level.maze_width
-                   for item in objects)
+        return all(level.is_in_maze(item) for item in objects)
+
+
+class Maze:
+    """Base of the levels. It holds the maze size and builds the barrier
+    grid and the index of the free cells. The subclasses return their
+    free cells from _get_free_cells
+
+    """
+    def __init__(self, level, rng=None):
+        """Initialize a new empty maze
+
+        level - the number of the level
+        rng - random.Random instance used to move the apple
+
+        """
+        self.level = level
+        self.rng = rng if rng is not None else random.Random()
+        self.snake_max_length = 0
+        self.maze_width = 0
+        self.maze_height = 0
+
+    def is_in_maze(self, cell):
+        """Checks if the cell is in the bounds of the maze
+
+        cell - tuple (x, y)
+
+        """
+        return 0 <= cell[0] < self.maze_height and\
+            0 <= cell[1] < self.maze_width
+
+    def move_apple(self):
+        """Moves the apple at random free position. If there is no free
+        cell in the maze the apple is set to None and False is returned
+
+        """
+        free_cells = self._get_free_cells()
+        if len(free_cells) == 0:
+            self.apple = None
+            return False
+        self.apple = divmod(free_cells.choice(self.rng), self.maze_width)
+        return True
+
+    def _get_free_cells(self):
+        """Returns the FreeCellIndex with the cells where the apple
+        could be placed
+
+        """
+        raise NotImplementedError
+
+    def _cell_index(self, cell):
+        """Returns the index of the cell into the grids
+
+        """
+        return cell[0] * self.maze_width + cell[1]
+
+    def _build_grid(self):
+        """Returns new barrier grid. The grid is a flat bytearray with
+        one Cell constant per maze cell
+
+        """
+        grid = bytearray(self.maze_width * self.maze_height)
+        for brick in self.barrier:
+            if self.is_in_maze(brick):
+                grid[self._cell_index(brick)] = Cell.BARRIER
+        return grid
 
-    def __is_not_visited(self, lines, x, y):
-        """Checks if the sneak block is not visited. If there is no
-        snake block on (x, y) then this method returns false
+    def _build_free_cells(self, grid):
+        """Returns new FreeCellIndex with the cells which are not part
+        of the barrier
 
-        lines - list of strings representing the maze
+        grid - the barrier grid
 
         """
-        snake = self.current_level.snake
-        return (x, y) not in snake and lines[x][y] == '%'
+        empty = grid.translate(_EMPTY_CELLS_TABLE)
+        return FreeCellIndex(len(grid), compress(range(len(grid)), empty))
 
 
-class Level:
+class Level(Maze):
     """This class holds all the information about snake's level
     and the logic about it
 
     """
-    def __init__(self, level):
-        self.level = level
-        self.snake_max_length = 0
+    def __init__(self, level, rng=None):
+        """Initialize a new empty level
+
+        level - the number of the level
+        rng - random.Random instance used to move the apple
+
+        """
+        Maze.__init__(self, level, rng)
         self.snake = []
         self.barrier = []
-        self.maze_width = 0
-        self.maze_height = 0
         self.apple = (0, 0)
         self.snake_direction = (0, 0)
 
+    def __getstate__(self):
+        """The barrier grid and the free cells are not pickled.
+        They are rebuilt on first use
+
+        """
+        state = self.__dict__.copy()
+        state['_Level__barrier'] = self.barrier
+        state['_Level__grid'] = None
+        state['_Level__free_cells'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled level. Levels pickled by older versions
+        of the game keep the snake as a list and don't have a grid
+
+        """
+        state = state.copy()
+        snake = state.pop('snake', None)
+        barrier = state.pop('barrier', None)
+        state.setdefault('rng', random.Random())
+        self.__dict__.update(state)
+        if snake is not None:
+            self.snake = snake
+        if barrier is not None:
+            self.barrier = barrier
+        self.__grid = None
+        self.__free_cells = None
+        self.__barrier_hash = None
+
+    @property
+    def snake(self):
+        """The snake's body as SnakeBody. The first block is the head
+
+        """
+        return self.__snake
+
+    @snake.setter
+    def snake(self, blocks):
+        free_cells = self.__dict__.get('_Level__free_cells')
+        if free_cells is not None:
+            for block in self.__snake:
+                if self.is_in_maze(block):
+                    free_cells.add(self._cell_index(block))
+        self.__snake = SnakeBody(blocks)
+        if free_cells is not None:
+            for block in self.__snake:
+                if self.is_in_maze(block):
+                    free_cells.remove(self._cell_index(block))
+
+    @property
+    def barrier(self):
+        """List with the barrier's bricks. If the barrier is set as grid
+        the list is built on first use
+
+        """
+        if self.__barrier is None:
+            grid = self.__grid
+            self.__barrier = [divmod(index, self.maze_width)
+                              for index in compress(range(len(grid)), grid)]
+        return self.__barrier
+
+    @barrier.setter
+    def barrier(self, bricks):
+        self.__barrier = bricks
+        self.__grid = None
+        self.__free_cells = None
+        self.__barrier_hash = None
+
+    def set_barrier_grid(self, grid):
+        """Sets the barrier as grid
+
+        grid - bytearray with one Cell constant per maze cell
+
+        """
+        self.__barrier = None
+        self.__grid = grid
+        self.__free_cells = None
+        self.__barrier_hash = None
+
+    @property
+    def barrier_hash(self):
+        """Hash of the maze size and the barrier. It is used to check
+        that a saved game is loaded with the same level
+
+        """
+        if self.__barrier_hash is None:
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(struct.pack('<II', self.maze_width,
+                                      self.maze_height))
+            digest.update(self.__get_grid())
+            self.__barrier_hash = digest.digest()
+        return self.__barrier_hash
+
     @property
     def snake_length(self):
         """The current snake length
@@ -173,34 +568,170 @@ class Level:
         """
         return len(self.snake)
 
-    def move(self, game_move):
+    def move(self, game_move, deltas=None):
         """Change the state of the game using the specified move
 
+        game_move - GameMove's constant
+        deltas - optional list to which the LevelDelta of the move
+        is appended
+
         """
         result = LevelState.RUNNING
+        tail = None
+        apple = None
+        free_cells = self._get_free_cells()
         self.__calculate_new_direction(game_move)
-        self.__move_snake_head()
-        if self.__snake_barrier_collision() or self.__snake_snake_collision():
+        head = self.__move_snake_head()
+        if self.__snake_collision(head):
             result = LevelState.LOSE
-        elif self.__snake_apple_colission():
-            if self.snake_length == self.snake_max_length:
-                result = LevelState.WIN
-            else:
-                self.move_apple()
+            self.__free_cells = None
         else:
-            self.__move_snake_tail()
+            free_cells.remove(self._cell_index(head))
+            if head == self.apple:
+                if self.snake_length == self.snake_max_length:
+                    result = LevelState.WIN
+                elif not self.move_apple():
+                    result = LevelState.FULL
+                else:
+                    apple = self.apple
+            else:
+                tail = self.__move_snake_tail()
+        if deltas is not None:
+            deltas.append(LevelDelta(result, head, tail, apple))
         return result
 
-    def move_apple(self):
-        """Moves the apple at random position
+    def apply_delta(self, delta):
+        """Changes the level like the move which produced the delta.
+        The level must be in the same state as the moved level before
+        the move.
+
+        delta - LevelDelta
 
         """
-        while True:
-            x_apple = random.randint(0, self.maze_height - 1)
-            y_apple = random.randint(0, self.maze_width - 1)
-            self.apple = (x_apple, y_apple)
-            if not self.__apple_colission():
-                break
+        free_cells = self.__free_cells
+        old_head = self.__snake.head
+        self.snake_direction = (delta.head[0] - old_head[0],
+                                delta.head[1] - old_head[1])
+        self.__snake.push_head(delta.head)
+        if delta.state == LevelState.LOSE:
+            self.__free_cells = None
+        elif free_cells is not None:
+            free_cells.remove(self._cell_index(delta.head))
+        if delta.tail is not None:
+            tail = self.__snake.pop_tail()
+            if free_cells is not None and tail not in self.__snake:
+                free_cells.add(self._cell_index(tail))
+        if delta.state == LevelState.FULL:
+            self.apple = None
+        elif delta.apple is not None:
+            self.apple = delta.apple
+
+    def copy(self, rng=None, snake=None):
+        """Returns new level with the same state. The barrier grid never
+        changes so it is shared between the copies
+
+        rng - random.Random instance of the new level
+        snake - optional list of tuples with the snake of the new level
+
+        """
+        level = Level(self.level, rng)
+        level.snake_max_length = self.snake_max_length
+        level.maze_width = self.maze_width
+        level.maze_height = self.maze_height
+        level.apple = self.apple
+        level.snake_direction = self.snake_direction
+        level.__barrier = self.__barrier
+        level.__barrier_hash = self.__barrier_hash
+        level.__grid = self.__get_grid()
+        free_cells = self._get_free_cells().copy()
+        if snake is None:
+            level.__snake = SnakeBody(self.__snake)
+        else:
+            height, width = self.maze_height, self.maze_width
+            for x, y in self.__snake:
+                if 0 <= x < height and 0 <= y < width:
+                    free_cells.add(x * width + y)
+            level.__snake = SnakeBody(snake)
+            for x, y in level.__snake:
+                if 0 <= x < height and 0 <= y < width:
+                    free_cells.remove(x * width + y)
+        level.__free_cells = free_cells
+        return level
+
+    def find_problems(self):
+        """Checks if the level could be played to the end. Returns list
+        with the descriptions of the found problems. It is empty if
+        there are no problems.
+
+        """
+        problems = []
+        if self.snake_length >= self.snake_max_length:
+            problems.append('The snake is not shorter than snake max length')
+        grid = self.__get_grid()
+        free_cells = self._get_free_cells()
+        if len(free_cells) + self.snake_length < self.snake_max_length:
+            problems.append('The maze is too small for snake max length')
+        reachable = self.__count_reachable_cells(grid, free_cells)
+        if reachable < len(free_cells):
+            problems.append('{0} apple positions are unreachable'\
+                .format(len(free_cells) - reachable))
+        return problems
+
+    def __count_reachable_cells(self, grid, free_cells):
+        """Returns the number of the free cells which could be reached
+        from the snake's head. The snake's body is passable because
+        it moves out of the way.
+
+        """
+        width = self.maze_width
+        start = self._cell_index(self.snake.head)
+        visited = bytearray(grid)
+        visited[start] = 1
+        queue = deque([start])
+        reachable = 0
+        while queue:
+            cell = queue.popleft()
+            if cell in free_cells:
+                reachable += 1
+            x, y = divmod(cell, width)
+            neighbours = []
+            if x > 0:
+                neighbours.append(cell - width)
+            if x < self.maze_height - 1:
+                neighbours.append(cell + width)
+            if y > 0:
+                neighbours.append(cell - 1)
+            if y < width - 1:
+                neighbours.append(cell + 1)
+            for neighbour in neighbours:
+                if not visited[neighbour]:
+                    visited[neighbour] = 1
+                    queue.append(neighbour)
+        return reachable
+
+    def __get_grid(self):
+        """Returns the barrier grid. The grid is a flat bytearray with
+        one Cell constant per maze cell. It is built on first use because
+        the barrier is filled after the level is created
+
+        """
+        if self.__grid is None:
+            self.__grid = self._build_grid()
+        return self.__grid
+
+    def _get_free_cells(self):
+        """Returns the index of the cells which are neither part of the
+        barrier nor of the snake. It is built on first use and then it
+        is updated when the snake moves
+
+        """
+        if self.__free_cells is None:
+            free_cells = self._build_free_cells(self.__get_grid())
+            for block in self.snake:
+                if self.is_in_maze(block):
+                    free_cells.remove(self._cell_index(block))
+            self.__free_cells = free_cells
+        return self.__free_cells
 
     def __calculate_new_direction(self, game_move):
         """This method calculates the snake direction after a game move
@@ -208,83 +739,462 @@ class Level:
         game_move - GameMove's constant
 
         """
-        if self.snake_direction[0] == 0:
-            if game_move == GameMoves.UP:
-                self.snake_direction = (-1, 0)
-            elif game_move == GameMoves.DOWN:
-                self.snake_direction = (1, 0)
-        elif self.snake_direction[1] == 0:
-            if game_move == GameMoves.LEFT:
-                self.snake_direction = (0, -1)
-            elif game_move == GameMoves.RIGHT:
-                self.snake_direction = (0, 1)
+        self.snake_direction = _turn(self.snake_direction, game_move)
 
     def __move_snake_head(self):
         """Move the snake head using the current snake direction
+        Returns the new head
 
         """
         old_head = self.snake[0]
         x_new_head = old_head[0] + self.snake_direction[0]
         y_new_head = old_head[1] + self.snake_direction[1]
-        self.snake.insert(0, (x_new_head, y_new_head))
+        new_head = (x_new_head, y_new_head)
+        self.__snake.push_head(new_head)
+        return new_head
 
     def __move_snake_tail(self):
-        """Move the snake tail
+        """Move the snake tail. Returns the removed block
 
         """
-        self.snake.pop()
+        tail = self.__snake.pop_tail()
+        if tail not in self.__snake:
+            self.__free_cells.add(self._cell_index(tail))
+        return tail
 
-    def __snake_barrier_collision(self):
-        """Checks if there is collision between the snake and the
-        barrier's bricks
+    def __snake_collision(self, head):
+        """Checks if the new snake head collides with the maze's bounds,
+        the barrier's bricks or the snake itself. The tail is not moved
+        yet so it is still an obstacle
 
         """
-        head = self.snake[0]
-        x_head = head[0]
-        y_head = head[1]
-        if x_head < 0 or x_head >= self.maze_height or\
-           y_head < 0 or y_head >= self.maze_width:
+        if not self.is_in_maze(head):
             return True
+        return self.__grid[self._cell_index(head)] != Cell.EMPTY\
+            or self.__snake.count(head) > 1
+
+class SnakeBody:
+    """The snake's blocks ordered from the head to the tail.
+    It keeps a deque of the blocks and a companion hash of the block
+    counts so moving the head or the tail and checking if a block is
+    part of the snake are done in constant time. It compares equal
+    to lists and tuples with the same blocks.
+
+    """
+    def __init__(self, blocks=()):
+        """Initialize a new snake body
+
+        blocks - iterable of tuples (x, y), the first one is the head
+
+        """
+        self.__blocks = deque(blocks)
+        self.__counts = Counter(self.__blocks)
+
+    def __len__(self):
+        return len(self.__blocks)
+
+    def __iter__(self):
+        return iter(self.__blocks)
+
+    def __reversed__(self):
+        return reversed(self.__blocks)
+
+    def __contains__(self, block):
+        return block in self.__counts
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self.__blocks)[index]
+        return self.__blocks[index]
+
+    def __eq__(self, other):
+        if isinstance(other, SnakeBody):
+            return self.__blocks == other.__blocks
+        elif isinstance(other, (list, tuple)):
+            return list(self.__blocks) == list(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'SnakeBody({0!r})'.format(list(self.__blocks))
+
+    @property
+    def head(self):
+        """The first block of the snake
+
+        """
+        return self.__blocks[0]
+
+    @property
+    def tail(self):
+        """The last block of the snake
+
+        """
+        return self.__blocks[-1]
+
+    def count(self, block):
+        """Returns how many times the block is part of the snake
+
+        """
+        return self.__counts.get(block, 0)
+
+    def push_head(self, block):
+        """Adds new head in front of the snake
+
+        """
+        self.__blocks.appendleft(block)
+        self.__add(block)
+
+    def append(self, block):
+        """Adds new block after the tail of the snake
+
+        """
+        self.__blocks.append(block)
+        self.__add(block)
+
+    def pop_tail(self):
+        """Removes the last block of the snake and returns it
+
+        """
+        block = self.__blocks.pop()
+        count = self.__counts[block]
+        if count == 1:
+            del self.__counts[block]
         else:
-            return any(brick == block for block in self.snake
-                                      for brick in self.barrier)
+            self.__counts[block] = count - 1
+        return block
+
+    def __add(self, block):
+        self.__counts[block] = self.__counts.get(block, 0) + 1
+
+
+_EMPTY_CELLS_TABLE = bytes([1]) + bytes(255)
+
+class FreeCellIndex:
+    """Set of maze cell indexes which allows adding, removing and
+    picking a random cell in constant time. The cells are kept in an array
+    and removing a cell swaps it with the last one.
+
+    """
+    def __init__(self, size, cells=()):
+        """Initialize a new index
+
+        size - the number of the cells in the maze
+        cells - iterable of distinct cells which are initially free
+
+        """
+        self.__cells = array.array('i', cells)
+        self.__positions = array.array('i', [-1]) * size
+        for position, cell in enumerate(self.__cells):
+            self.__positions[cell] = position
 
-    def __snake_apple_colission(self):
-        """Checks if there is collision between the snake and the apple
+    def __len__(self):
+        return len(self.__cells)
+
+    def __contains__(self, cell):
+        return self.__positions[cell] != -1
+
+    def add(self, cell):
+        """Adds the cell to the index if it is not already there
 
         """
-        return any(self.apple == block for block in self.snake)
+        if self.__positions[cell] == -1:
+            self.__positions[cell] = len(self.__cells)
+            self.__cells.append(cell)
 
-    def __apple_colission(self):
-        """Checks if there is collision between the apple and snake
-        or between the apple and the barrier
+    def remove(self, cell):
+        """Removes the cell from the index if it is there
 
         """
-        return any(self.apple == block for block in self.snake)\
-            or any(self.apple == brick for brick in self.barrier)
+        position = self.__positions[cell]
+        if position != -1:
+            last = self.__cells.pop()
+            if last != cell:
+                self.__cells[position] = last
+                self.__positions[last] = position
+            self.__positions[cell] = -1
 
-    def __snake_snake_collision(self):
-        """Checks if there is collision between the snake itself
+    def copy(self):
+        """Returns new index with the same cells
 
         """
-        return any(i != j and block1 == block2
-            for i, block1 in enumerate(self.snake)
-            for j, block2 in enumerate(self.snake))
+        index = FreeCellIndex(0)
+        index.__cells = self.__cells[:]
+        index.__positions = self.__positions[:]
+        return index
+
+    def choice(self, rng):
+        """Returns random cell from the index
+
+        rng - random.Random instance
+
+        """
+        return self.__cells[rng.randrange(len(self.__cells))]
+
+
+class ArenaLevel(Maze):
+    """Level played by many snakes at the same time. All the snakes move
+    together on each tick and share one apple.
+
+    Every maze cell is owned by at most one snake block. The owners are
+    kept in a flat grid next to the barrier grid, so checking a new head
+    against the barrier, all the bodies and the other new heads takes
+    constant time and a tick costs O(snakes). The tails are not moved
+    before the check, so like in Level they are still obstacles.
+    The snakes which lose or win are removed from the maze.
+
+    """
+    def __init__(self, level, rng=None):
+        """Initialize a new empty arena
+
+        level - the number of the level
+        rng - random.Random instance used to move the apple
+
+        """
+        Maze.__init__(self, level, rng)
+        self.snakes = []
+        self.snake_directions = []
+        self.states = []
+        self.apple = None
+        self.barrier = []
+
+    @property
+    def barrier(self):
+        """List with the barrier's bricks
+
+        """
+        return self.__barrier
+
+    @barrier.setter
+    def barrier(self, bricks):
+        self.__barrier = bricks
+        self.__grid = None
+        self.__owners = None
+        self.__free_cells = None
+
+    @property
+    def running_count(self):
+        """The number of the snakes which are still running
+
+        """
+        return self.states.count(LevelState.RUNNING)
+
+    def add_snake(self, blocks, direction):
+        """Adds new running snake to the arena. Returns its number
+
+        blocks - list of tuples (x, y), the first one is the head
+        direction - tuple (x, y) with the snake's direction
+
+        """
+        number = len(self.snakes)
+        self.snakes.append(SnakeBody(blocks))
+        self.snake_directions.append(direction)
+        self.states.append(LevelState.RUNNING)
+        if self.__owners is not None:
+            for block in blocks:
+                self.__occupy(block, number)
+        return number
+
+    def owner(self, cell):
+        """Returns the number of the snake which occupies the cell or
+        None if the cell is not part of a running snake
+
+        cell - tuple (x, y) in the maze
+
+        """
+        number = self.__get_owners()[self._cell_index(cell)]
+        return number if number != -1 else None
+
+    def move(self, game_moves):
+        """Moves all the running snakes and returns list with the
+        LevelState of every snake. The finished snakes are not moved.
+        If there is no apple in the maze it is placed after the move.
+
+        game_moves - list with one GameMoves constant per snake
+
+        """
+        owners = self.__get_owners()
+        grid = self.__grid
+        heads = {}
+        for number, state in enumerate(self.states):
+            if state == LevelState.RUNNING:
+                direction = _turn(self.snake_directions[number],
+                                  game_moves[number])
+                self.snake_directions[number] = direction
+                head = self.snakes[number].head
+                heads[number] = (head[0] + direction[0],
+                                 head[1] + direction[1])
+        head_counts = Counter(heads.values())
+        for number, head in heads.items():
+            if not self.is_in_maze(head) or head_counts[head] > 1:
+                self.states[number] = LevelState.LOSE
+                continue
+            index = self._cell_index(head)
+            if grid[index] != Cell.EMPTY or owners[index] != -1:
+                self.states[number] = LevelState.LOSE
+        is_apple_eaten = False
+        for number, head in heads.items():
+            if self.states[number] != LevelState.RUNNING:
+                continue
+            snake = self.snakes[number]
+            snake.push_head(head)
+            self.__occupy(head, number)
+            if head == self.apple:
+                is_apple_eaten = True
+                if len(snake) == self.snake_max_length:
+                    self.states[number] = LevelState.WIN
+            else:
+                self.__release(snake.pop_tail())
+        for number in heads:
+            if self.states[number] != LevelState.RUNNING:
+                for block in self.snakes[number]:
+                    self.__release(block)
+        if is_apple_eaten or self.apple is None:
+            self.move_apple()
+        return list(self.states)
+
+    def _get_free_cells(self):
+        """Returns the free cells. They are built together with the
+        ownership grid
+
+        """
+        self.__get_owners()
+        return self.__free_cells
+
+    def __get_owners(self):
+        """Returns the ownership grid. It is a flat array with the number
+        of the snake which occupies each cell or -1. It is built on first
+        use together with the barrier grid and the free cells
+
+        """
+        if self.__owners is None:
+            self.__grid = self._build_grid()
+            self.__owners = array.array('i', [-1]) * len(self.__grid)
+            self.__free_cells = self._build_free_cells(self.__grid)
+            for number, snake in enumerate(self.snakes):
+                if self.states[number] == LevelState.RUNNING:
+                    for block in snake:
+                        self.__occupy(block, number)
+        return self.__owners
+
+    def __occupy(self, cell, number):
+        """Marks the cell as part of the snake
+
+        """
+        index = self._cell_index(cell)
+        self.__owners[index] = number
+        self.__free_cells.remove(index)
+
+    def __release(self, cell):
+        """Marks the cell as free
+
+        """
+        index = self._cell_index(cell)
+        self.__owners[index] = -1
+        self.__free_cells.add(index)
+
+
+class InputBuffer:
+    """Bounded queue of the moves pressed by the player between the game
+    ticks. One move is taken on each tick, so quick turns are not lost.
+    The moves which don't change the snake's direction after the already
+    queued moves, like going back or going forward, are dropped.
+
+    """
+    def __init__(self, max_size=3):
+        """Initialize a new empty buffer
+
+        max_size - the maximal number of the queued moves
+
+        """
+        self.max_size = max_size
+        self.dropped = 0
+        self.__moves = deque()
+        self.__direction = None
+
+    def __len__(self):
+        return len(self.__moves)
+
+    @property
+    def depth(self):
+        """The number of the queued moves
+
+        """
+        return len(self.__moves)
+
+    def push(self, game_move, snake_direction):
+        """Adds the move at the end of the queue. Returns False if the
+        move is dropped
+
+        game_move - GameMoves constant
+        snake_direction - the current direction of the snake
+
+        """
+        direction = self.__direction if self.__moves else snake_direction
+        new_direction = _turn(direction, game_move)
+        if new_direction == direction or len(self.__moves) == self.max_size:
+            self.dropped += 1
+            return False
+        self.__moves.append(game_move)
+        self.__direction = new_direction
+        return True
+
+    def pop(self):
+        """Removes the first move and returns it. GameMoves.PASS is
+        returned if the queue is empty
+
+        """
+        if self.__moves:
+            return self.__moves.popleft()
+        return GameMoves.PASS
+
+    def clear(self):
+        """Removes all the queued moves
+
+        """
+        self.__moves.clear()
+
 
 class Game:
     """This class is used to simulate the snake game move by move.
     It uses the Level class to initialize itself.
 
     """
-    def __init__(self, level_manager):
+    def __init__(self, level_manager, seed=None):
         """Initialize a new game class
 
         level_manager - manager to provide the parsed levels
+        seed - seed or random.Random instance used for the apples.
+        The random generator is saved together with the game so the
+        game could be reproduced.
 
         """
         self.level_manager = level_manager
+        self.journal = None
+        self.recorder = None
+        if seed is not None:
+            self.level_manager.rng = _make_rng(seed)
         self.level_manager.load_next_level()
 
+    def __getstate__(self):
+        """The journal and the replay recorder are not pickled
+
+        """
+        state = self.__dict__.copy()
+        state['journal'] = None
+        state['recorder'] = None
+        return state
+
+    def __setstate__(self, state):
+        """Restores a pickled game. The games pickled by older versions
+        of the game don't have journal and replay recorder
+
+        """
+        self.__dict__.update(state)
+        self.journal = None
+        self.recorder = None
+
     @property
     def current_level(self):
         """Returns current level object
@@ -294,11 +1204,45 @@ class Game:
 
     @staticmethod
     def load_game_from_file(filename):
-        """Factory method to desirialize a game from file
+        """Factory method to desirialize a game from file. The games
+        saved by older versions of the game with pickle are loaded too.
 
         """
         with open(filename, 'rb') as file:
-            return pickle.load(file)
+            data = file.read()
+        if data.startswith(_SAVE_MAGIC):
+            return Game.from_snapshot(decode_snapshot(data))
+        return pickle.loads(data)
+
+    @staticmethod
+    def from_snapshot(snapshot):
+        """Factory method to create a game from GameSnapshot. The level
+        is loaded from the level source stored into the snapshot.
+        SaveFormatError is raised if the level is changed since the
+        snapshot was taken.
+
+        """
+        # the generator is not seeded because its state is restored
+        rng = random.Random.__new__(random.Random)
+        rng.setstate(snapshot.rng_state)
+        level_manager = LevelManager(snapshot.level_path, rng)
+        level = level_manager.restore_level(snapshot.level_number,
+            snapshot.snake, snapshot.apple, snapshot.snake_direction)
+        if level.barrier_hash != snapshot.barrier_hash:
+            raise SaveFormatError('The level is changed since the game '
+                                  'was saved')
+        game = Game.__new__(Game)
+        game.__setstate__({'level_manager': level_manager})
+        return game
+
+    def snapshot(self):
+        """Returns immutable GameSnapshot with the state of the game
+
+        """
+        level = self.current_level
+        return GameSnapshot(self.level_manager.level_path, level.level,
+            level.barrier_hash, level.maze_width, tuple(level.snake),
+            level.apple, level.snake_direction, level.rng.getstate())
 
     def save(self, filename):
         """Save the state of the game
@@ -306,23 +1250,867 @@ class Game:
         filename - file to store the serialized game
 
         """
-        with open(filename, 'wb') as file:
-            pickle.dump(self, file)
+        _write_file_atomically(filename, encode_snapshot(self.snapshot()))
+
+    def start_journal(self, filename, checkpoint_interval=100):
+        """Starts journaling of the game. Every move is appended to a log
+        and the whole game is saved every checkpoint_interval moves.
+        The game could be restored with Game.recover.
+
+        filename - the file of the saved game. The log is stored into
+        file with the same name and JOURNAL_EXTENSION
+        checkpoint_interval - the number of moves between two saves
+
+        """
+        self.stop_journal()
+        self.journal = GameJournal(self, filename, checkpoint_interval)
+
+    def stop_journal(self):
+        """Stops journaling of the game and closes the log
+
+        """
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def start_recording(self, keyframe_interval=100):
+        """Starts recording of the game's replay from its current state.
+        Returns the ReplayRecorder.
+
+        keyframe_interval - the number of moves between two keyframes
+
+        """
+        self.recorder = ReplayRecorder(self, keyframe_interval)
+        return self.recorder
+
+    def stop_recording(self):
+        """Stops recording of the game's replay. Returns the Replay or
+        None if the game is not recorded
+
+        """
+        if self.recorder is None:
+            return None
+        replay = self.recorder.replay()
+        self.recorder = None
+        return replay
+
+    @staticmethod
+    def recover(filename):
+        """Factory method to restore a journaled game. The last saved
+        game is loaded and the moves from the log are applied to it.
+
+        filename - the file of the saved game
+
+        """
+        return GameJournal.recover(filename)
 
-    def move(self, game_move):
+    def move(self, game_move, deltas=None):
         """Change the state of the game using the specified move
 
+        game_move - GameMove's constant
+        deltas - optional list to which the LevelDelta of the move
+        is appended
+
         """
-        result = self.current_level.move(game_move)
-        if result == LevelState.WIN:
+        result = self.current_level.move(game_move, deltas)
+        if result == LevelState.WIN or result == LevelState.FULL:
             try:
                 self.level_manager.load_next_level()
             except LastLevelError:
                 self.level_manager.reset();
         elif result == LevelState.LOSE:
             self.level_manager.reset();
+        if self.journal is not None:
+            self.journal.record(game_move)
+        if self.recorder is not None:
+            self.recorder.record(game_move)
+        return result
+
+
+JOURNAL_EXTENSION = '.journal'
+
+class GameJournal:
+    """Append-only log of the moves of a game with periodic saves of the
+    whole game called checkpoints. Each log record is a move and the
+    apple position after it. The log starts with the hash of its
+    checkpoint so a log which is older than the checkpoint is ignored.
+    The log is buffered so the last moves could be lost on crash.
+
+    """
+    def __init__(self, game, filename, checkpoint_interval=100):
+        """Starts journaling of the game. A checkpoint is written
+        immediately
+
+        game - the journaled Game
+        filename - the file of the checkpoint
+        checkpoint_interval - the number of moves between checkpoints
+
+        """
+        self.game = game
+        self.filename = filename
+        self.checkpoint_interval = checkpoint_interval
+        self.moves = 0
+        self.__log = None
+        self.checkpoint()
+
+    def record(self, game_move):
+        """Appends the move to the log. A checkpoint is written if the
+        checkpoint interval is reached
+
+        game_move - GameMoves constant which is applied to the game
+
+        """
+        apple = self.game.current_level.apple
+        if apple is None:
+            apple = (-1, -1)
+        self.__log.write(_JOURNAL_RECORD.pack(game_move, apple[0], apple[1]))
+        self.moves += 1
+        if self.moves >= self.checkpoint_interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Saves the whole game and starts new log
+
+        """
+        data = encode_snapshot(self.game.snapshot())
+        _write_file_atomically(self.filename, data)
+        if self.__log is not None:
+            self.__log.close()
+        self.__log = open(self.filename + JOURNAL_EXTENSION, 'wb')
+        self.__log.write(_JOURNAL_HEADER.pack(_JOURNAL_MAGIC,
+                                              _journal_checkpoint_hash(data)))
+        self.moves = 0
+
+    def flush(self):
+        """Writes the buffered log records to the disk
+
+        """
+        self.__log.flush()
+
+    def close(self):
+        """Flushes and closes the log
+
+        """
+        self.__log.close()
+
+    @staticmethod
+    def recover(filename):
+        """Loads the checkpoint and applies the moves from its log.
+        Returns the restored Game.
+
+        filename - the file of the checkpoint
+
+        """
+        with open(filename, 'rb') as file:
+            data = file.read()
+        game = Game.from_snapshot(decode_snapshot(data))
+        try:
+            with open(filename + JOURNAL_EXTENSION, 'rb') as file:
+                log = file.read()
+        except FileNotFoundError:
+            return game
+        header = _JOURNAL_HEADER.size
+        if log[:header] != _JOURNAL_HEADER.pack(_JOURNAL_MAGIC,
+                                                _journal_checkpoint_hash(data)):
+            return game
+        complete = header + (len(log) - header) //\
+            _JOURNAL_RECORD.size * _JOURNAL_RECORD.size
+        for game_move, x_apple, y_apple in\
+            _JOURNAL_RECORD.iter_unpack(log[header:complete]):
+            game.move(game_move)
+            if x_apple == -1:
+                game.current_level.apple = None
+            else:
+                game.current_level.apple = (x_apple, y_apple)
+        return game
+
+
+class Replay:
+    """Recorded game. It contains the moves of the game and keyframes
+    with the state of the game every keyframe_interval moves. The first
+    keyframe is the initial state of the game and it contains the level
+    reference and the state of the random generator.
+
+    """
+    def __init__(self, moves, keyframes, keyframe_interval):
+        """Initialize a new replay
+
+        moves - bytes with one GameMoves constant per move
+        keyframes - list of GameSnapshot, keyframes[i] is the state of
+        the game before move number i * keyframe_interval
+        keyframe_interval - the number of moves between two keyframes
+
+        """
+        self.moves = moves
+        self.keyframes = keyframes
+        self.keyframe_interval = keyframe_interval
+
+    def __len__(self):
+        return len(self.moves)
+
+    def save(self, filename):
+        """Writes the replay into file. The moves are compressed and
+        the keyframes are stored in the binary save format
+
+        """
+        moves = zlib.compress(self.moves)
+        data = [_REPLAY_HEADER.pack(_REPLAY_MAGIC, _REPLAY_VERSION,
+                    self.keyframe_interval, len(self.keyframes),
+                    len(moves)),
+                moves]
+        for keyframe in self.keyframes:
+            encoded = encode_snapshot(keyframe)
+            data.append(struct.pack('<I', len(encoded)))
+            data.append(encoded)
+        _write_file_atomically(filename, b''.join(data))
+
+    @staticmethod
+    def load(filename):
+        """Factory method to read a replay from file. SaveFormatError is
+        raised if the file is not a replay
+
+        """
+        with open(filename, 'rb') as file:
+            data = file.read()
+        try:
+            magic, version, keyframe_interval, keyframe_count, moves_size =\
+                _REPLAY_HEADER.unpack_from(data, 0)
+            if magic != _REPLAY_MAGIC or version != _REPLAY_VERSION:
+                raise SaveFormatError('Unknown replay format')
+            offset = _REPLAY_HEADER.size
+            moves = zlib.decompress(data[offset:offset + moves_size])
+            offset += moves_size
+            keyframes = []
+            for i in range(keyframe_count):
+                size, = struct.unpack_from('<I', data, offset)
+                offset += 4
+                keyframes.append(
+                    decode_snapshot(data[offset:offset + size]))
+                offset += size
+        except (struct.error, zlib.error):
+            raise SaveFormatError('The replay is damaged')
+        return Replay(moves, keyframes, keyframe_interval)
+
+
+class ReplayRecorder:
+    """This class records the moves of a game into Replay. It is
+    created by Game.start_recording.
+
+    """
+    def __init__(self, game, keyframe_interval=100):
+        """Initialize a new recorder. The current state of the game
+        is the first keyframe
+
+        game - the recorded Game
+        keyframe_interval - the number of moves between two keyframes
+
+        """
+        self.game = game
+        self.keyframe_interval = keyframe_interval
+        self.moves = bytearray()
+        self.keyframes = [game.snapshot()]
+
+    def record(self, game_move):
+        """Appends the move to the replay. It is called by the game
+        after the move is applied
+
+        """
+        self.moves.append(game_move)
+        if len(self.moves) % self.keyframe_interval == 0:
+            self.keyframes.append(self.game.snapshot())
+
+    def replay(self):
+        """Returns Replay with the recorded moves
+
+        """
+        return Replay(bytes(self.moves), list(self.keyframes),
+                      self.keyframe_interval)
+
+
+class ReplayPlayer:
+    """This class plays Replay. It could seek to any move in time which
+    does not depend on the replay length because it starts from the
+    nearest keyframe.
+
+    """
+    def __init__(self, replay):
+        """Initialize a new player at the start of the replay
+
+        """
+        self.replay = replay
+        self.game = None
+        self.tick = 0
+        self.seek(0)
+
+    @property
+    def is_finished(self):
+        """True if all the moves of the replay are played
+
+        """
+        return self.tick >= len(self.replay)
+
+    def seek(self, tick):
+        """Moves the game to its state before the move number tick
+
+        """
+        tick = max(0, min(tick, len(self.replay)))
+        interval = self.replay.keyframe_interval
+        keyframe = tick // interval
+        if self.game is None or tick < self.tick or\
+            keyframe > self.tick // interval:
+            self.game = Game.from_snapshot(self.replay.keyframes[keyframe])
+            self.tick = keyframe * interval
+        self.step(tick - self.tick)
+
+    def step(self, count=1):
+        """Plays the next count moves. Returns the state of the level
+        after the last move or None if no move is played
+
+        """
+        result = None
+        end = min(self.tick + count, len(self.replay))
+        for game_move in self.replay.moves[self.tick:end]:
+            result = self.game.move(game_move)
+        self.tick = max(self.tick, end)
         return result
 
+
+_REPLAY_MAGIC = b'SNKR'
+_REPLAY_VERSION = 1
+# magic, version, keyframe interval, keyframe count, compressed moves size
+_REPLAY_HEADER = struct.Struct('<4sBIII')
+
+class LevelMirror:
+    """Copy of a level which is kept in sync from a stream of encoded
+    LevelDelta records. It is used by the spectators, so only the
+    changed cells are sent after the initial snapshot.
+
+    """
+    def __init__(self, snapshot):
+        """Initialize a new mirror
+
+        snapshot - the level encoded with encode_level_snapshot
+
+        """
+        try:
+            number, apple_x, apple_y = _MIRROR_HEADER.unpack_from(snapshot, 0)
+        except struct.error:
+            raise LevelFormatError('Incorrect level snapshot')
+        self.level = decode_level(
+            memoryview(snapshot)[_MIRROR_HEADER.size:], number)
+        self.level.apple = (apple_x, apple_y) if apple_x != -1 else None
+        self.state = LevelState.RUNNING
+        self.deltas = 0
+        self.__buffer = bytearray()
+
+    def feed(self, data):
+        """Applies all the complete deltas in data. The incomplete record
+        at the end is kept until the rest of it is fed. Returns the
+        number of the applied deltas
+
+        data - bytes-like object with encoded deltas
+
+        """
+        buffer = self.__buffer
+        buffer += data
+        offset = 0
+        count = 0
+        level = self.level
+        while True:
+            result = decode_delta(buffer, offset)
+            if result is None:
+                break
+            delta, offset = result
+            level.apply_delta(delta)
+            self.state = delta.state
+            count += 1
+        del buffer[:offset]
+        self.deltas += count
+        return count
+
+
+class AutoSaver:
+    """This class saves games on a background thread. The state of the
+    game is copied into GameSnapshot by the caller so the game could be
+    changed immediately. If the writer falls behind only the newest
+    snapshot for each file is saved.
+
+    """
+    def __init__(self):
+        """Initialize a new auto saver and starts its thread
+
+        """
+        self.last_save_duration = None
+        self.last_error = None
+        self.saves = 0
+        self.coalesced = 0
+        self.__pending = OrderedDict()
+        self.__saving = False
+        self.__closed = False
+        self.__condition = threading.Condition()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+        self.__thread.start()
+
+    def save(self, game, filename):
+        """Requests saving of the game. The method returns immediately.
+
+        game - the saved Game
+        filename - file to store the serialized game
+
+        """
+        snapshot = game.snapshot()
+        with self.__condition:
+            if filename in self.__pending:
+                self.coalesced += 1
+            self.__pending[filename] = snapshot
+            self.__condition.notify_all()
+
+    def wait(self):
+        """Waits until all requested saves are written
+
+        """
+        with self.__condition:
+            while self.__pending or self.__saving:
+                self.__condition.wait()
+
+    def close(self):
+        """Writes the requested saves and stops the thread
+
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    def pop_error(self):
+        """Returns the error of the last failed save and clears it.
+        None is returned if no save is failed since the last call
+
+        """
+        with self.__condition:
+            error = self.last_error
+            self.last_error = None
+        return error
+
+    def __run(self):
+        """The loop of the background thread
+
+        """
+        while True:
+            with self.__condition:
+                while not self.__pending and not self.__closed:
+                    self.__condition.wait()
+                if not self.__pending:
+                    return
+                filename, snapshot = self.__pending.popitem(last=False)
+                self.__saving = True
+            start = time.perf_counter()
+            try:
+                _write_file_atomically(filename, encode_snapshot(snapshot))
+            except (IOError, struct.error) as ex:
+                self.last_error = ex
+            with self.__condition:
+                self.last_save_duration = time.perf_counter() - start
+                self.saves += 1
+                self.__saving = False
+                self.__condition.notify_all()
+
+
+_JOURNAL_MAGIC = b'SNKJ'
+# magic and hash of the checkpoint
+_JOURNAL_HEADER = struct.Struct('<4s16s')
+# move, apple x, apple y
+_JOURNAL_RECORD = struct.Struct('<Bhh')
+
+def _journal_checkpoint_hash(data):
+    """Returns the hash of the checkpoint stored into the log's header
+
+    """
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _get_mtime(filename):
+    """Returns the modification time of the file in nanoseconds or None
+    if the file doesn't exist. LevelIOError is raised if the file could
+    not be accessed
+
+    """
+    try:
+        return os.stat(filename).st_mtime_ns
+    except IOError as ex:
+        if ex.errno == 2:
+            return None
+        raise LevelIOError()
+
+def _write_file_atomically(filename, data):
+    """Writes the data into temporary file and then renames it so the
+    file is never left half written
+
+    """
+    temp_filename = filename + '.tmp'
+    with open(temp_filename, 'wb') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_filename, filename)
+
+GameSnapshot = namedtuple('GameSnapshot', ['level_path', 'level_number',
+    'barrier_hash', 'maze_width', 'snake', 'apple', 'snake_direction',
+    'rng_state'])
+GameSnapshot.__doc__ = """Immutable state of a game. The level is stored as
+reference to the level source and hash of its barrier."""
+
+LevelDelta = namedtuple('LevelDelta', ['state', 'head', 'tail', 'apple'])
+LevelDelta.__doc__ = """Change of a level after one move. The tail is the
+removed block and the apple is the new apple. They are None if the tail
+or the apple are not moved."""
+
+# state and flags, head x, head y
+_DELTA_HEADER = struct.Struct('<Bhh')
+# x, y of the tail or the apple
+_DELTA_CELL = struct.Struct('<hh')
+_DELTA_STATE_MASK = 0x07
+_DELTA_TAIL = 0x08
+_DELTA_APPLE = 0x10
+# level number, apple x, apple y
+_MIRROR_HEADER = struct.Struct('<Ihh')
+
+def encode_delta(delta):
+    """Returns the LevelDelta in binary format. The record has 5 bytes
+    and 4 more bytes for each of the tail and the apple if they are moved
+
+    """
+    flags = delta.state
+    cells = b''
+    if delta.tail is not None:
+        flags |= _DELTA_TAIL
+        cells += _DELTA_CELL.pack(*delta.tail)
+    if delta.apple is not None:
+        flags |= _DELTA_APPLE
+        cells += _DELTA_CELL.pack(*delta.apple)
+    return _DELTA_HEADER.pack(flags, *delta.head) + cells
+
+def decode_delta(data, offset=0):
+    """Decodes one LevelDelta from data. Returns tuple with the delta
+    and the offset after it or None if the data ends before the record
+
+    data - bytes-like object with encoded deltas
+    offset - the position of the record in data
+
+    """
+    end = offset + _DELTA_HEADER.size
+    if len(data) < end:
+        return None
+    flags, head_x, head_y = _DELTA_HEADER.unpack_from(data, offset)
+    if flags & _DELTA_TAIL:
+        end += _DELTA_CELL.size
+    if flags & _DELTA_APPLE:
+        end += _DELTA_CELL.size
+    if len(data) < end:
+        return None
+    offset += _DELTA_HEADER.size
+    tail = None
+    apple = None
+    if flags & _DELTA_TAIL:
+        tail = _DELTA_CELL.unpack_from(data, offset)
+        offset += _DELTA_CELL.size
+    if flags & _DELTA_APPLE:
+        apple = _DELTA_CELL.unpack_from(data, offset)
+        offset += _DELTA_CELL.size
+    return LevelDelta(flags & _DELTA_STATE_MASK, (head_x, head_y),
+                      tail, apple), end
+
+def encode_level_snapshot(level):
+    """Returns the full state of the level used to start a LevelMirror.
+    It is the level number and the apple followed by the compiled level.
+
+    """
+    apple = level.apple if level.apple is not None else (-1, -1)
+    return _MIRROR_HEADER.pack(level.level, *apple) + encode_level(level)
+
+_SAVE_MAGIC = b'SNKS'
+_SAVE_VERSION = 1
+# magic, version, level number, barrier hash, maze width, snake length,
+# apple, x direction, y direction, length of the level path
+_SAVE_HEADER = struct.Struct('<4sBI16sIIibbH')
+# random generator version, gauss_next and its presence
+_RNG_HEADER = struct.Struct('<BBd')
+_RNG_STATE_SIZE = 625
+
+def encode_snapshot(snapshot):
+    """Returns the GameSnapshot in the binary save format. The snake
+    blocks and the apple are stored as cell indexes.
+
+    """
+    level_path = snapshot.level_path.encode('utf-8')
+    width = snapshot.maze_width
+    apple = snapshot.apple
+    apple_index = -1 if apple is None else apple[0] * width + apple[1]
+    header = _SAVE_HEADER.pack(_SAVE_MAGIC, _SAVE_VERSION,
+        snapshot.level_number, snapshot.barrier_hash, width,
+        len(snapshot.snake), apple_index, snapshot.snake_direction[0],
+        snapshot.snake_direction[1], len(level_path))
+    snake = struct.pack('<{0}I'.format(len(snapshot.snake)),
+                        *(x * width + y for x, y in snapshot.snake))
+    version, state, gauss_next = snapshot.rng_state
+    rng_header = _RNG_HEADER.pack(version, gauss_next is not None,
+                                  gauss_next or 0.0)
+    rng_state = struct.pack('<{0}I'.format(_RNG_STATE_SIZE), *state)
+    return header + level_path + snake + rng_header + rng_state
+
+def decode_snapshot(data):
+    """Returns GameSnapshot from data in the binary save format.
+    SaveFormatError is raised if the data is not correct save.
+
+    """
+    try:
+        magic, version, level_number, barrier_hash, width, snake_length,\
+            apple_index, x_direction, y_direction, path_length =\
+            _SAVE_HEADER.unpack_from(data, 0)
+        if magic != _SAVE_MAGIC or version != _SAVE_VERSION:
+            raise SaveFormatError('Unknown save format')
+        offset = _SAVE_HEADER.size
+        level_path = bytes(data[offset:offset + path_length]).decode('utf-8')
+        offset += path_length
+        cells = struct.unpack_from('<{0}I'.format(snake_length),
+                                   data, offset)
+        offset += snake_length * 4
+        rng_version, has_gauss_next, gauss_next =\
+            _RNG_HEADER.unpack_from(data, offset)
+        offset += _RNG_HEADER.size
+        rng_state = array.array('I', data[offset:offset + _RNG_STATE_SIZE * 4])
+    except (struct.error, UnicodeDecodeError):
+        raise SaveFormatError('The save is damaged')
+    if len(rng_state) != _RNG_STATE_SIZE:
+        raise SaveFormatError('The save is damaged')
+    if sys.byteorder == 'big':
+        rng_state.byteswap()
+    apple = None if apple_index == -1 else divmod(apple_index, width)
+    return GameSnapshot(level_path, level_number, barrier_hash, width,
+        tuple(divmod(cell, width) for cell in cells), apple,
+        (x_direction, y_direction), (rng_version, tuple(rng_state),
+        gauss_next if has_gauss_next else None))
+
+def _make_rng(seed):
+    """Returns random.Random instance from seed. If the seed is already
+    random.Random instance it is returned as it is
+
+    """
+    if isinstance(seed, random.Random):
+        return seed
+    return random.Random(seed)
+
+class LevelPack:
+    """Single file with many compiled levels. The file starts with an
+    index with the offset and the size of each level so any level
+    could be read without reading the others. The file is memory-mapped
+    and the levels are decoded only when they are read.
+
+    """
+    def __init__(self, filename):
+        """Opens the level pack. IOError is raised if the file could not
+        be opened and LevelFormatError if it is not a level pack.
+
+        filename - the path of the level pack
+
+        """
+        with open(filename, 'rb') as file:
+            self.mtime = os.fstat(file.fileno()).st_mtime_ns
+            try:
+                self.__data = mmap.mmap(file.fileno(), 0,
+                                        access=mmap.ACCESS_READ)
+            except ValueError: # the file is empty
+                raise LevelFormatError('Incorrect level pack')
+        try:
+            magic, version, self.__count =\
+                _LEVEL_PACK_HEADER.unpack_from(self.__data, 0)
+        except struct.error:
+            magic, version, self.__count = None, None, 0
+        index_end = _LEVEL_PACK_HEADER.size +\
+            _LEVEL_PACK_ENTRY.size * self.__count
+        if magic != _LEVEL_PACK_MAGIC or version != _LEVEL_PACK_VERSION\
+            or len(self.__data) < index_end:
+            self.close()
+            raise LevelFormatError('Incorrect level pack')
+
+    def __len__(self):
+        return self.__count
+
+    def read_level(self, number):
+        """Decodes and returns the level with the given number
+
+        number - the number of the level starting from 1
+
+        """
+        if not 1 <= number <= self.__count:
+            raise IndexError('There is no level {0}'.format(number))
+        entry_offset = _LEVEL_PACK_HEADER.size +\
+            _LEVEL_PACK_ENTRY.size * (number - 1)
+        offset, size = _LEVEL_PACK_ENTRY.unpack_from(self.__data,
+                                                     entry_offset)
+        return decode_level(self.__data[offset:offset + size], number)
+
+    def close(self):
+        """Closes the level pack file
+
+        """
+        self.__data.close()
+
+    @staticmethod
+    def write(filename, levels):
+        """Writes the levels into level pack file. The file is replaced
+        at once, so the packs which are already open keep their data
+
+        filename - the path of the level pack
+        levels - list of Level objects ordered by their number
+
+        """
+        blobs = [encode_level(level) for level in levels]
+        offset = _LEVEL_PACK_HEADER.size + _LEVEL_PACK_ENTRY.size * len(blobs)
+        parts = [_LEVEL_PACK_HEADER.pack(_LEVEL_PACK_MAGIC,
+                                         _LEVEL_PACK_VERSION, len(blobs))]
+        for blob in blobs:
+            parts.append(_LEVEL_PACK_ENTRY.pack(offset, len(blob)))
+            offset += len(blob)
+        parts.extend(blobs)
+        _write_file_atomically(filename, b''.join(parts))
+
+
+_LEVEL_PACK_MAGIC = b'SNKP'
+_LEVEL_PACK_VERSION = 1
+# magic, version, number of levels
+_LEVEL_PACK_HEADER = struct.Struct('<4sBI')
+# offset and size of a level
+_LEVEL_PACK_ENTRY = struct.Struct('<QI')
+
+_COMPILED_LEVEL_MAGIC = b'SNKL'
+_COMPILED_LEVEL_VERSION = 1
+# magic, version, width, height, snake max length, snake length
+_COMPILED_LEVEL_HEADER = struct.Struct('<4sBIIII')
+# the barrier bitmap byte expanded to eight Cell constants
+_BITMAP_TABLE = [bytes((byte >> bit) & 1 for bit in range(8))
+                 for byte in range(256)]
+
+def encode_level(level):
+    """Returns the level in the compiled binary format. The format
+    contains header, the snake blocks from the head to the tail as
+    cell indexes and the barrier as bitmap with one bit per cell.
+    The apple is not stored.
+
+    level - the Level which is compiled
+
+    """
+    width = level.maze_width
+    height = level.maze_height
+    if not all(level.is_in_maze(block) for block in level.snake):
+        raise LevelFormatError('Incorrect width or height')
+    header = _COMPILED_LEVEL_HEADER.pack(_COMPILED_LEVEL_MAGIC,
+        _COMPILED_LEVEL_VERSION, width, height, level.snake_max_length,
+        level.snake_length)
+    snake = struct.pack('<{0}I'.format(level.snake_length),
+                        *(x * width + y for x, y in level.snake))
+    bitmap = bytearray((width * height + 7) // 8)
+    for brick in level.barrier:
+        if level.is_in_maze(brick):
+            index = brick[0] * width + brick[1]
+            bitmap[index >> 3] |= 1 << (index & 7)
+    return header + snake + bytes(bitmap)
+
+def decode_level(data, number=1):
+    """Returns new Level from data in the compiled binary format.
+    The barrier bitmap is expanded directly into the level's barrier
+    grid and the list of bricks is built only if it is used.
+
+    data - bytes-like object or mmap
+    number - the number of the level
+
+    """
+    try:
+        magic, version, width, height, snake_max_length, snake_length =\
+            _COMPILED_LEVEL_HEADER.unpack_from(data, 0)
+    except struct.error:
+        raise LevelFormatError('Incorrect compiled level')
+    if magic != _COMPILED_LEVEL_MAGIC or version != _COMPILED_LEVEL_VERSION:
+        raise LevelFormatError('Incorrect compiled level')
+    snake_offset = _COMPILED_LEVEL_HEADER.size
+    bitmap_offset = snake_offset + snake_length * 4
+    bitmap_end = bitmap_offset + (width * height + 7) // 8
+    if len(data) < bitmap_end:
+        raise LevelFormatError('Incorrect compiled level')
+    if snake_length < 2:
+        raise LevelFormatError('Snake must be at least with two elements')
+    cells = struct.unpack_from('<{0}I'.format(snake_length),
+                               data, snake_offset)
+    level = Level(number)
+    level.snake_max_length = snake_max_length
+    level.maze_width = width
+    level.maze_height = height
+    level.snake = [divmod(cell, width) for cell in cells]
+    snake = level.snake
+    level.snake_direction = (snake[0][0] - snake[1][0],
+                             snake[0][1] - snake[1][1])
+    bitmap = data[bitmap_offset:bitmap_end]
+    grid = bytearray(b''.join(map(_BITMAP_TABLE.__getitem__, bitmap)))
+    del grid[width * height:]
+    level.set_barrier_grid(grid)
+    return level
+
+def _turn(direction, game_move):
+    """Returns the snake direction after a game move. The snake could
+    not turn back
+
+    direction - tuple (x, y) with the current direction
+    game_move - GameMove's constant
+
+    """
+    if direction[0] == 0:
+        if game_move == GameMoves.UP:
+            return (-1, 0)
+        elif game_move == GameMoves.DOWN:
+            return (1, 0)
+    elif direction[1] == 0:
+        if game_move == GameMoves.LEFT:
+            return (0, -1)
+        elif game_move == GameMoves.RIGHT:
+            return (0, 1)
+    return direction
+
+def _find_all(line, char):
+    """Returns the positions of all occurrences of char in line
+
+    """
+    position = line.find(char)
+    while position != -1:
+        yield position
+        position = line.find(char, position + 1)
+
+def _trace_snake(head, segments, height, width):
+    """Returns list with the snake blocks starting from the head. On each
+    step the first not visited neighbour is taken in the order
+    up, down, left, right.
+
+    head - tuple (x, y) with the snake's head
+    segments - set with the not visited snake blocks. The visited blocks
+    are removed from it.
+    height, width - the size of the maze
+
+    """
+    snake = [head]
+    x, y = head
+    while True:
+        if x > 0 and (x - 1, y) in segments:
+            x -= 1
+        elif x < height - 1 and (x + 1, y) in segments:
+            x += 1
+        elif y > 0 and (x, y - 1) in segments:
+            y -= 1
+        elif y < width - 1 and (x, y + 1) in segments:
+            y += 1
+        else:
+            break
+        segments.remove((x, y))
+        snake.append((x, y))
+    return snake
+
 def _parse_int_config(string, config):
     """This funciton extracts value from config file.
 
@@ -346,6 +2134,15 @@ class LevelState:
     RUNNING = 1
     WIN = 2
     LOSE = 3
+    FULL = 4 # there is no free cell left for the apple
+
+
+class Cell:
+    """This are the values stored into the level's barrier grid
+
+    """
+    EMPTY = 0
+    BARRIER = 1
 
 
 class GameMoves:
@@ -358,6 +2155,12 @@ class GameMoves:
     RIGHT = 4
     PASS = 5
 
+class SaveFormatError(Exception):
+    """This exception is raised when a saved game could not be loaded
+
+    """
+    pass
+
 class LevelError(Exception):
     """Base level related error class"""
     pass
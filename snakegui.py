@@ -3,10 +3,12 @@
 """
 
 import sys, pygame, glob
+from collections import OrderedDict
+from time import perf_counter
 from constants import *
 from pygame.locals import *
 from snakecore import *
-from pygame import Color, display, time, font, draw, Surface, image
+from pygame import Color, display, time, font, draw, Surface, image, Rect
 
 class MainUI:
     """The game's user interface class
@@ -24,27 +26,84 @@ class MainUI:
         self.fpsClock = time.Clock()
         self.state = None
         self.frame = 0
+        self.tick_interval = 1000 / GUI_TICKS_PER_SECOND
+        self.accumulator = 0
         self.green_color = Color(0, 200, 0)
+        self.autosaver = AutoSaver()
+        self.assets = AssetManager()
+        self.assets.preload(GUI_IMAGES)
+        self.__drawn_state = None
 
     def start(self):
-        """Starts the drawing and event handling of the game
+        """Starts the drawing and event handling of the game.
+        The game is advanced with fixed timestep. The time of each frame
+        is accumulated and the state is updated once for every tick
+        interval in it, so the game speed doesn't depend on the frame
+        rate. At most GUI_MAX_TICKS_PER_FRAME ticks are run in one frame
+        and the rest of the delay is dropped.
 
         """
         while True:
+            self.state.handle_events()
+            self.accumulator += self.fpsClock.tick(GUI_FPS)
+            ticks = 0
+            while self.accumulator >= self.tick_interval:
+                if ticks == GUI_MAX_TICKS_PER_FRAME:
+                    self.accumulator %= self.tick_interval
+                    break
+                self.update()
+                self.accumulator -= self.tick_interval
+                ticks += 1
+            self.draw()
+            self.frame += 1
+
+    def draw(self):
+        """Draws the current state. The states which support dirty
+        rectangles redraw only the changed parts of the previous frame
+        of the same state. The other states are drawn from scratch.
+
+        """
+        rects = None
+        draw_dirty = getattr(self.state, 'draw_dirty', None)
+        if draw_dirty is not None and self.state is self.__drawn_state:
+            rects = draw_dirty()
+        self.__drawn_state = self.state
+        if rects is None:
             self.surface.fill(self.green_color)
             self.state.draw()
-            self.state.handle_events()
             display.update()
-            self.fpsClock.tick(30)
-            self.frame += 1
+        elif rects:
+            display.update(rects)
+
+    def quit(self):
+        """Writes the requested saves and closes the game. The error of
+        a failed save is printed because the window is closed
+
+        """
+        self.autosaver.close()
+        error = self.autosaver.pop_error()
+        if error is not None:
+            print('The game could not be saved: {0}'.format(error))
+        pygame.quit()
+        sys.exit()
+
+    def update(self):
+        """Advances the current state with one tick. The menus are not
+        updated
+
+        """
+        update = getattr(self.state, 'update', None)
+        if update is not None:
+            update()
 
 
 class Menu:
     """Class used to draw a menu and handle menu events
 
     """
-    def __init__(self, menu_text_list, font_size=100,\
+    def __init__(self, main_ui, menu_text_list, font_size=100,\
         distance=140, first=100, cursor=30):
+        self.main_ui = main_ui
         self.menu_items_pos = [x * distance + first\
             for x in range(len(menu_text_list))]
         self.menu_text_list= menu_text_list
@@ -52,7 +111,7 @@ class Menu:
             self.selected_index = 0
         else:
             self.selected_index = -1
-        self.menu_font = font.Font(None, font_size)
+        self.menu_font = main_ui.assets.font(font_size)
         self.orange_color = Color(224, 76, 27)
         self.green_color = Color(42, 77, 6)
         self.cursor = cursor
@@ -66,8 +125,7 @@ class Menu:
     def get_events(self):
         for event in pygame.event.get():
             if event.type == QUIT:
-                pygame.quit()
-                sys.exit()
+                self.main_ui.quit()
             elif  event.type == KEYDOWN:
                 return self.__handle_key_press(event.key)
 
@@ -95,7 +153,8 @@ class Menu:
             (780 - self.cursor, cursor_height + self.cursor)])
 
     def __draw_menu_item(self, surface, text, item_pos):
-        menu_item = self.menu_font.render(text, False, self.green_color)
+        menu_item = text_cache.render(self.menu_font, text, False,
+            self.green_color)
         menu_start_pos =\
             (surface.get_width() / 2 - menu_item.get_width() / 2,
              self.menu_items_pos[item_pos])
@@ -110,7 +169,7 @@ class MainMenuUI:
     def __init__(self, main_ui):
         self.main_ui = main_ui
         menu_text_list = ["START", "LOAD", "EXIT"]
-        self.menu = Menu(menu_text_list)
+        self.menu = Menu(main_ui, menu_text_list)
         self.white_color = Color(255, 255, 255)
 
     def draw(self):
@@ -125,8 +184,7 @@ class MainMenuUI:
             load_ui = LoadMenuUI(self.main_ui)
             self.main_ui.state = load_ui
         elif index == 2:
-            pygame.quit()
-            sys.exit()
+            self.main_ui.quit()
 
 
 class LoadMenuUI:
@@ -138,7 +196,7 @@ class LoadMenuUI:
         self.filenames = glob.glob(SAVE_FILE_TEMPLATE.format('*'))
         names = [name[name.rindex('\\') + 1:name.rindex('.')]
             for name in self.filenames]
-        self.menu = Menu(names, 50, 40, 3, 16)
+        self.menu = Menu(main_ui, names, 50, 40, 3, 16)
 
     def draw(self):
         self.menu.draw(self.main_ui.surface)
@@ -149,9 +207,13 @@ class LoadMenuUI:
             self.main_ui.state = MainMenuUI(self.main_ui)
         elif index != None:
             filename = self.filenames[index]
-            game = Game.load_game_from_file(filename)
-            game_ui = SnakeUI(self.main_ui, game)
-            self.main_ui.state = game_ui
+            try:
+                game = Game.load_game_from_file(filename)
+            except (SaveFormatError, LevelError) as ex:
+                self.main_ui.state = ErrorUI(self.main_ui, str(ex))
+            else:
+                game_ui = SnakeUI(self.main_ui, game)
+                self.main_ui.state = game_ui
 
 
 class SaveMenuUI:
@@ -162,15 +224,16 @@ class SaveMenuUI:
         self.main_ui = main_ui
         self.snake_ui= snake_ui
         self.name = ''
-        self.text_font = font.Font(None, 50)
+        self.text_font = main_ui.assets.font(50)
         self.black_color = Color(0, 0, 0)
         self.green_color = Color(42, 77, 6)
 
     def draw(self):
         text = self.name
-        message_surface = self.text_font.render("Save name: ",\
-            False, self.green_color)
-        text_surface = self.text_font.render(text, False, self.black_color)
+        message_surface = text_cache.render(self.text_font,\
+            "Save name: ", False, self.green_color)
+        text_surface = text_cache.render(self.text_font, text, False,
+            self.black_color)
         self.main_ui.surface.blit(message_surface, (0, 3))
         text_pos = (message_surface.get_width(), 3)
         self.main_ui.surface.blit(text_surface, text_pos)
@@ -178,8 +241,7 @@ class SaveMenuUI:
     def handle_events(self):
         for event in pygame.event.get():
             if event.type == QUIT:
-                pygame.quit()
-                sys.exit()
+                self.main_ui.quit()
             elif event.type == KEYDOWN:
                 self.__handle_key_down(event.key)
 
@@ -192,7 +254,7 @@ class SaveMenuUI:
                 game = self.snake_ui.snake_game
                 self.snake_ui.is_running = True
                 filename = SAVE_FILE_TEMPLATE.format(self.name)
-                game.save(filename)
+                self.main_ui.autosaver.save(game, filename)
                 self.main_ui.state = self.snake_ui
         elif key == K_BACKSPACE:
             self.name = self.name[:-1]
@@ -215,8 +277,8 @@ class GameMenuUI:
     def __init__(self, main_ui, snake_ui):
         self.main_ui = main_ui
         self.snake_ui = snake_ui
-        menu_text_list = ["SAVE", "EXIT", "CLOSE"]
-        self.menu = Menu(menu_text_list)
+        menu_text_list = ["SAVE", "REPLAY", "EXIT", "CLOSE"]
+        self.menu = Menu(main_ui, menu_text_list)
         self.white_color = Color(255, 255, 255)
 
     def draw(self):
@@ -229,8 +291,16 @@ class GameMenuUI:
         if index == 0:
             self.main_ui.state = SaveMenuUI(self.main_ui, self.snake_ui)
         elif index == 1:
+            recorder = self.snake_ui.snake_game.recorder
+            try:
+                replay_ui = ReplayUI(self.main_ui, recorder.replay(), self)
+            except (SaveFormatError, LevelError) as ex:
+                self.main_ui.state = ErrorUI(self.main_ui, str(ex), self)
+            else:
+                self.main_ui.state = replay_ui
+        elif index == 2:
             self.main_ui.state = MainMenuUI(self.main_ui)
-        elif index == 2 or index == -1:
+        elif index == 3 or index == -1:
             self.main_ui.state = self.snake_ui
             self.snake_ui.is_running = True
 
@@ -239,14 +309,23 @@ class ErrorUI:
     """The UI state used to display critical error message
 
     """
-    def __init__(self, main_ui, message):
+    def __init__(self, main_ui, message, back_ui=None):
+        """Creates new ErrorUI object
+
+        message - the shown message
+        back_ui - the state which is shown when escape or enter is
+        pressed. The message could be closed only if it is given
+
+        """
         self.main_ui = main_ui
         self.message = message
-        self.menu_font = font.Font(None, 50)
+        self.back_ui = back_ui
+        self.menu_font = main_ui.assets.font(50)
         self.red_color = Color(255, 0, 0)
 
     def draw(self):
-        text = self.menu_font.render(self.message, False, self.red_color)
+        text = text_cache.render(self.menu_font, self.message, False,
+            self.red_color)
         text_width = text.get_width()
         text_height = text.get_height()
         surface_width = self.main_ui.surface.get_width()
@@ -256,22 +335,81 @@ class ErrorUI:
         self.main_ui.surface.blit(text, position)
 
     def handle_events(self):
-        for current_event in event.get():
+        for current_event in pygame.event.get():
+            if current_event.type == QUIT:
+                self.main_ui.quit()
+            elif current_event.type == KEYDOWN and self.back_ui is not None\
+                and current_event.key in (K_ESCAPE, K_RETURN):
+                self.main_ui.state = self.back_ui
+
+class ReplayUI:
+    """The UI state used to play a replay. The arrows left and right
+    seek and the arrows up and down change the speed
+
+    """
+    def __init__(self, main_ui, replay, back_ui):
+        """Creates new ReplayUI object
+
+        replay - the played Replay
+        back_ui - the state which is shown when the replay is closed
+
+        """
+        self.main_ui = main_ui
+        self.back_ui = back_ui
+        self.player = ReplayPlayer(replay)
+        self.speed = 1
+        self.progress = 0
+        self.snake_ui = SnakeUI(main_ui, self.player.game, record=False)
+        self.snake_ui.is_running = False
+
+    def update(self):
+        self.progress += self.speed
+        moves = int(self.progress)
+        self.progress -= moves
+        self.player.step(moves)
+
+    def draw(self):
+        self.snake_ui.snake_game = self.player.game
+        self.snake_ui.draw()
+
+    def handle_events(self):
+        interval = self.player.replay.keyframe_interval
+        for current_event in pygame.event.get():
             if current_event.type == QUIT:
-                pygame.quit()
-                sys.exit()
+                self.main_ui.quit()
+            elif current_event.type == KEYDOWN:
+                if current_event.key == K_LEFT:
+                    self.player.seek(self.player.tick - interval)
+                elif current_event.key == K_RIGHT:
+                    self.player.seek(self.player.tick + interval)
+                elif current_event.key == K_UP:
+                    self.speed = min(self.speed * 2, 64)
+                elif current_event.key == K_DOWN:
+                    self.speed = max(self.speed / 2, 1 / 8)
+                elif current_event.key == K_ESCAPE:
+                    self.main_ui.state = self.back_ui
+
 
 class SnakeUI:
     """Snake's game menu
 
     """
-    def __init__(self, main_ui, game=None):
+    KEY_MOVES = {K_LEFT: GameMoves.LEFT, K_RIGHT: GameMoves.RIGHT,
+                 K_UP: GameMoves.UP, K_DOWN: GameMoves.DOWN}
+
+    def __init__(self, main_ui, game=None, record=True):
+        """Creates new SnakeUI object
+
+        game - the played game. New game is started if it is not given
+        record - whether the moves of the game are recorded for replays
+
+        """
         if game != None:
             self.snake_game = game
         else:
             level_manager = LevelManager(LEVELS_DIRECTORY)
             self.snake_game = Game(level_manager)
-        self.last_move = GameMoves.PASS
+        self.input_buffer = InputBuffer(GUI_INPUT_BUFFER_SIZE)
         self.main_ui = main_ui
         level = self.snake_game.current_level
         self.maze_size = (level.maze_height, level.maze_width)
@@ -280,34 +418,117 @@ class SnakeUI:
         self.green_color = Color(151, 255, 148)
         self.white_color = Color(255, 255, 255)
         self.black_color = Color(0, 0, 0)
-        self.apple = image.load('images/apple.png')
-        self.block = image.load('images/block.png')
-        self.brick = image.load('images/brick.jpg')
+        self.apple = main_ui.assets.image('apple.png')
+        self.block = main_ui.assets.image('block.png')
+        self.brick = main_ui.assets.image('brick.jpg')
         #fonts
-        self.info_font = font.Font(None, 23)
+        self.info_font = main_ui.assets.font(23)
         self.is_running = True
+        self.dirty_rects = GUI_DIRTY_RECTS
+        self.deltas = []
+        self.__drawn_level = None
+        self.__drawn_apple = None
+        self.__drawn_info = None
+        self.__info_rect = None
+        self.__game_position = (0, 0)
+        self.__background_key = None
+        self.background = None
+        self.last_autosave = time.get_ticks()
+        if record and self.snake_game.recorder is None:
+            self.snake_game.start_recording()
+
+    def update(self):
+        error = self.main_ui.autosaver.pop_error()
+        if error is not None:
+            message = 'The game could not be saved: {0}'.format(error)
+            self.main_ui.state = ErrorUI(self.main_ui, message, self)
+            return
+        if self.is_running:
+            state = self.snake_game.move(self.input_buffer.pop(),
+                                         self.deltas)
+            if state != LevelState.RUNNING:
+                self.input_buffer.clear()
+            self.__autosave()
 
     def draw(self):
-        if self.is_running and self.main_ui.frame % GUI_GAME_SPEED == 0:
-            self.snake_game.move(self.last_move)
-            self.last_move = GameMoves.PASS
         level = self.snake_game.current_level
-        if self.maze_size != (level.maze_width, level.maze_height):
-            self.maze_size = (level.maze_height, level.maze_width)
-            self.game_surface = Surface(transform(self.maze_size, 2, 2))
-        self.game_surface.fill(self.green_color)
+        background_key = (level.maze_height, level.maze_width,
+                          level.barrier_hash)
+        if self.__background_key != background_key:
+            self.__build_background(level)
+            self.__background_key = background_key
+        self.game_surface.blit(self.background, (0, 0))
         self.__draw_apple()
         self.__draw_snake()
-        self.__draw_barrier()
         self.__draw_level_info()
         surface_width = self.main_ui.surface.get_width()
         surface_height = self.main_ui.surface.get_height()
         game_width = self.game_surface.get_width()
         game_height = self.game_surface.get_height()
-        y_pos = surface_width / 2 - game_width / 2
-        x_pos  = surface_height / 2 - game_height / 2
+        y_pos = surface_width // 2 - game_width // 2
+        x_pos  = surface_height // 2 - game_height // 2
         game_surface_pos = (y_pos, x_pos)
         self.main_ui.surface.blit(self.game_surface, game_surface_pos)
+        self.__game_position = game_surface_pos
+        self.__drawn_level = level
+        self.__drawn_apple = level.apple
+        del self.deltas[:]
+
+    def draw_dirty(self):
+        """Redraws only the cells changed by the moves since the last
+        frame and the level info. Returns list with the changed rects of
+        the main surface or None if the whole frame has to be drawn,
+        because the level is changed or the dirty rects are disabled
+
+        """
+        level = self.snake_game.current_level
+        if not self.dirty_rects or level is not self.__drawn_level:
+            return None
+        cells = set()
+        for delta in self.deltas:
+            cells.add(delta.head)
+            if delta.tail is not None:
+                cells.add(delta.tail)
+        del self.deltas[:]
+        if level.apple != self.__drawn_apple:
+            cells.add(self.__drawn_apple)
+            cells.add(level.apple)
+            self.__drawn_apple = level.apple
+        rects = [self.__draw_cell(cell) for cell in cells
+                 if cell is not None and level.is_in_maze(cell)]
+        if self.__level_info() != self.__drawn_info:
+            old_rect = self.__info_rect
+            self.main_ui.surface.fill(self.main_ui.green_color, old_rect)
+            self.__draw_level_info()
+            rects.append(old_rect.union(self.__info_rect))
+        return rects
+
+    def __draw_cell(self, cell):
+        """Redraws one maze cell and copies it to the main surface.
+        Returns the changed rect of the main surface
+
+        """
+        level = self.snake_game.current_level
+        cell_rect = Rect(transform(cell, 1, 1), (PIXEL, PIXEL))
+        self.game_surface.blit(self.background, cell_rect, cell_rect)
+        if cell == level.apple:
+            self.game_surface.blit(self.apple, cell_rect)
+        if cell in level.snake:
+            self.game_surface.blit(self.block, cell_rect)
+        screen_rect = cell_rect.move(self.__game_position)
+        self.main_ui.surface.blit(self.game_surface, screen_rect, cell_rect)
+        return screen_rect
+
+    def __autosave(self):
+        """Saves the game on the background if the autosave interval
+        is passed
+
+        """
+        now = time.get_ticks()
+        if now - self.last_autosave >= AUTOSAVE_INTERVAL * 1000:
+            self.last_autosave = now
+            filename = SAVE_FILE_TEMPLATE.format(AUTOSAVE_NAME)
+            self.main_ui.autosaver.save(self.snake_game, filename)
 
     def __draw_apple(self):
         apple_position = transform(self.snake_game.current_level.apple, 1, 1)
@@ -318,51 +539,171 @@ class SnakeUI:
         for block in level.snake:
             self.game_surface.blit(self.block, transform(block, 1, 1))
 
-    def __draw_barrier(self):
-        level = self.snake_game.current_level
+    def __build_background(self, level):
+        """Draws the parts of the level which never change into the
+        background surface. It is rebuilt only when the maze size or
+        the barrier are changed
+
+        """
+        self.maze_size = (level.maze_height, level.maze_width)
+        self.game_surface = Surface(transform(self.maze_size, 2, 2))
+        self.background = Surface(self.game_surface.get_size())
+        self.background.fill(self.green_color)
+        self.__draw_barrier(self.background, level)
+
+    def __draw_barrier(self, surface, level):
         for brick in level.barrier:
-            self.game_surface.blit(self.brick, transform(brick, 1, 1))
+            surface.blit(self.brick, transform(brick, 1, 1))
         brick_height = self.brick.get_height()
         brick_width = self.brick.get_width()
-        maze_height = self.game_surface.get_height()
-        maze_width = self.game_surface.get_width()
+        maze_height = surface.get_height()
+        maze_width = surface.get_width()
         for x in range(0, maze_width, brick_width):
-            self.game_surface.blit(self.brick, (x, 0))
+            surface.blit(self.brick, (x, 0))
         for x in range(0, maze_width, brick_width):
-            self.game_surface.blit(self.brick, (x, maze_height - brick_height))
+            surface.blit(self.brick, (x, maze_height - brick_height))
         for y in range(0, maze_height, brick_height):
-            self.game_surface.blit(self.brick, (0, y))
+            surface.blit(self.brick, (0, y))
         for y in range(0, maze_height, brick_height):
-            self.game_surface.blit(self.brick, (maze_width - brick_width, y))
+            surface.blit(self.brick, (maze_width - brick_width, y))
 
-    def __draw_level_info(self):
+    def __level_info(self):
         level = self.snake_game.current_level
         current_level = level.level
         snake_len = level.snake_length
         snake_max_len = level.snake_max_length
-        info ='Level: {0} Snake Length: {1}/{2}'\
+        return 'Level: {0} Snake Length: {1}/{2}'\
             .format(current_level, snake_len, snake_max_len)
-        info_surface = self.info_font.render(info, False, self.black_color)
-        self.main_ui.surface.blit(info_surface, (10, 10))
+
+    def __draw_level_info(self):
+        info = self.__level_info()
+        info_surface = text_cache.render(self.info_font, info, False,
+            self.black_color)
+        self.__info_rect = self.main_ui.surface.blit(info_surface, (10, 10))
+        self.__drawn_info = info
 
     def handle_events(self):
         for current_event in pygame.event.get():
             if current_event.type == QUIT:
-                pygame.quit()
-                sys.exit()
+                self.main_ui.quit()
             elif  current_event.type == KEYDOWN:
-                if current_event.key == K_LEFT:
-                   self.last_move = GameMoves.LEFT
-                elif current_event.key == K_RIGHT:
-                    self.last_move = GameMoves.RIGHT
-                elif current_event.key == K_UP:
-                    self.last_move = GameMoves.UP
-                elif current_event.key == K_DOWN:
-                    self.last_move = GameMoves.DOWN
+                if current_event.key in self.KEY_MOVES:
+                    direction = self.snake_game.current_level.snake_direction
+                    self.input_buffer.push(
+                        self.KEY_MOVES[current_event.key], direction)
                 elif current_event.key == K_ESCAPE:
                     self.main_ui.state = GameMenuUI(self.main_ui, self)
 
 
+class AssetManager:
+    """Loads the game images and fonts once and shares them between the
+    UI states. The images are converted to the pixel format of the
+    display, so it must be created after the display mode is set
+
+    """
+    def __init__(self, directory=IMAGES_DIRECTORY):
+        """Creates new AssetManager object
+
+        directory - the directory of the images
+
+        """
+        self.directory = directory
+        self.load_time = 0.0
+        self.__images = {}
+        self.__fonts = {}
+
+    def __len__(self):
+        return len(self.__images)
+
+    def preload(self, names):
+        """Loads the images before they are used
+
+        names - list with the file names of the images
+
+        """
+        for name in names:
+            self.image(name)
+
+    def image(self, name):
+        """Returns the converted image. It is loaded on first use
+
+        name - the file name of the image
+
+        """
+        surface = self.__images.get(name)
+        if surface is None:
+            start = perf_counter()
+            surface = image.load('{0}/{1}'.format(self.directory, name))
+            if surface.get_flags() & SRCALPHA:
+                surface = surface.convert_alpha()
+            else:
+                surface = surface.convert()
+            self.load_time += perf_counter() - start
+            self.__images[name] = surface
+        return surface
+
+    def font(self, size):
+        """Returns the default font with the given size. The same font
+        object is returned for each size, so the texts rendered with it
+        stay in the text cache when a new UI state is created
+
+        size - the size of the font
+
+        """
+        text_font = self.__fonts.get(size)
+        if text_font is None:
+            text_font = font.Font(None, size)
+            self.__fonts[size] = text_font
+        return text_font
+
+
+class TextCache:
+    """Cache of the rendered text surfaces. The surfaces are kept by
+    font, text, antialias and color and the least recently used one is
+    removed when the cache is full, so the texts which don't change are
+    rendered only once
+
+    """
+    def __init__(self, max_size=64):
+        """Creates new empty TextCache object
+
+        max_size - the maximal number of the kept surfaces
+
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self.__surfaces)
+
+    def render(self, text_font, text, antialias, color):
+        """Returns the text rendered with the font like font.render
+
+        """
+        key = (text_font, text, antialias, tuple(color))
+        surface = self.__surfaces.get(key)
+        if surface is not None:
+            self.__surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = text_font.render(text, antialias, color)
+        self.__surfaces[key] = surface
+        if len(self.__surfaces) > self.max_size:
+            self.__surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """Removes all the surfaces
+
+        """
+        self.__surfaces.clear()
+
+
+text_cache = TextCache(GUI_TEXT_CACHE_SIZE)
+
 def transform(coordinates, x_translation=0, y_translation=0):
     """This function transform coordinates from this form which
     is used in BL to the form used in pyGame
@@ -385,6 +726,9 @@ def show_error(mainUI, text):
 def main():
     try:
         main_ui = MainUI()
+        assets = main_ui.assets
+        print('Loaded {0} images in {1:.1f} ms'.format(len(assets),
+                                                      assets.load_time * 1000))
         menu_ui = MainMenuUI(main_ui)
         main_ui.state = menu_ui
         main_ui.start()
@@ -0,0 +1,257 @@
+"""Snake game server. It hosts many games for clients connected over TCP
+
+Usage: python snakeserver.py [--host <host>] [--port <port>]
+                             [--tick <seconds>]
+
+Every client plays its own game. The protocol is line based:
+    the server sends "HELLO <session id>" after the client is connected
+    the client sends UP, DOWN, LEFT, RIGHT or PASS to choose the next move
+    the client sends STATS to receive the server metrics
+    the client sends QUIT to close the connection
+    the server sends a state line after each game tick:
+    "TICK <tick> <level state> <level> <snake length>
+     <head x> <head y> <apple x> <apple y>"
+    the server sends "ERROR <message>" and closes the connection if the
+    game could not be started or advanced
+
+"""
+
+import argparse, asyncio, heapq, itertools
+from constants import *
+from snakecore import *
+
+class Session:
+    """Game played by one connected client
+
+    """
+    def __init__(self, session_id, game, writer, due):
+        """Initialize a new session
+
+        session_id - unique number of the session
+        game - the played Game
+        writer - asyncio.StreamWriter of the client
+        due - the loop time of the first tick
+
+        """
+        self.session_id = session_id
+        self.game = game
+        self.writer = writer
+        self.due = due
+        self.tick = 0
+        self.next_move = GameMoves.PASS
+        self.is_closed = False
+
+    def state_line(self, state):
+        """Returns the state line sent to the client after a tick
+
+        """
+        level = self.game.current_level
+        head = level.snake.head
+        apple = level.apple if level.apple is not None else (-1, -1)
+        return 'TICK {0} {1} {2} {3} {4} {5} {6} {7}\n'.format(self.tick,
+            state, level.level, level.snake_length, head[0], head[1],
+            apple[0], apple[1])
+
+
+class GameServer:
+    """Asyncio server which hosts many game sessions. One scheduler
+    wakes up every resolution seconds and advances all the sessions
+    whose tick is due, so there is no timer per session.
+
+    """
+    COMMANDS = {'UP': GameMoves.UP, 'DOWN': GameMoves.DOWN,
+                'LEFT': GameMoves.LEFT, 'RIGHT': GameMoves.RIGHT,
+                'PASS': GameMoves.PASS}
+
+    def __init__(self, level_path=LEVELS_DIRECTORY, tick_interval=GAME_SPEED,
+                 resolution=SERVER_RESOLUTION,
+                 max_buffer_size=SERVER_MAX_BUFFER_SIZE):
+        """Initialize a new server
+
+        level_path - the level directory or level pack of the games
+        tick_interval - seconds between two ticks of a game
+        resolution - seconds between two runs of the scheduler
+        max_buffer_size - the session is closed if more bytes are not
+        sent to its client
+
+        """
+        self.level_path = level_path
+        self.tick_interval = tick_interval
+        self.resolution = resolution
+        self.max_buffer_size = max_buffer_size
+        self.sessions = {}
+        self.ticks = 0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.last_lag = 0.0
+        self.__due = []
+        self.__ids = itertools.count(1)
+        self.__server = None
+        self.__scheduler = None
+
+    @property
+    def mean_lag(self):
+        """The mean delay in seconds between the due time and the real
+        time of the game ticks
+
+        """
+        return self.total_lag / self.ticks if self.ticks else 0.0
+
+    def stats_line(self):
+        """Returns the line with the server metrics
+
+        """
+        return 'STATS {0} {1} {2:.6f} {3:.6f} {4:.6f}\n'.format(
+            len(self.sessions), self.ticks, self.last_lag, self.mean_lag,
+            self.max_lag)
+
+    async def start(self, host='127.0.0.1', port=SERVER_PORT):
+        """Starts listening for clients and the scheduler. Returns the
+        port of the server
+
+        """
+        self.__server = await asyncio.start_server(self.__handle_client,
+                                                   host, port)
+        self.__scheduler = asyncio.ensure_future(self.__run_scheduler())
+        return self.__server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Stops the server and closes all the sessions
+
+        """
+        self.__server.close()
+        await self.__server.wait_closed()
+        self.__scheduler.cancel()
+        for session in list(self.sessions.values()):
+            self.__close_session(session)
+
+    def advance(self, now):
+        """Advances all the sessions whose tick is due. Returns the number
+        of the advanced sessions
+
+        now - the current loop time
+
+        """
+        count = 0
+        while self.__due and self.__due[0][0] <= now:
+            due, session_id = heapq.heappop(self.__due)
+            session = self.sessions.get(session_id)
+            if session is None or session.is_closed:
+                continue
+            try:
+                state = session.game.move(session.next_move)
+            except Exception as ex:
+                # one broken game must not stop the games of the others
+                self.__fail_session(session, ex)
+                continue
+            session.next_move = GameMoves.PASS
+            session.tick += 1
+            lag = now - due
+            self.ticks += 1
+            self.last_lag = lag
+            self.total_lag += lag
+            self.max_lag = max(self.max_lag, lag)
+            session.writer.write(session.state_line(state).encode())
+            if session.writer.transport.get_write_buffer_size() >\
+                self.max_buffer_size:
+                self.__close_session(session)
+                continue
+            session.due = max(due + self.tick_interval, now)
+            heapq.heappush(self.__due, (session.due, session_id))
+            count += 1
+        return count
+
+    async def __run_scheduler(self):
+        """Runs the scheduler until the server is closed
+
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            self.advance(loop.time())
+            await asyncio.sleep(self.resolution)
+
+    async def __handle_client(self, reader, writer):
+        """Serves one client
+
+        """
+        loop = asyncio.get_running_loop()
+        session_id = next(self.__ids)
+        try:
+            game = Game(LevelManager(self.level_path))
+        except (LevelError, IOError) as ex:
+            writer.write('ERROR {0}\n'.format(ex).encode())
+            writer.close()
+            return
+        session = Session(session_id, game, writer,
+                          loop.time() + self.tick_interval)
+        self.sessions[session_id] = session
+        heapq.heappush(self.__due, (session.due, session_id))
+        writer.write('HELLO {0}\n'.format(session_id).encode())
+        try:
+            while not session.is_closed:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode('ascii', 'replace').strip().upper()
+                if command in self.COMMANDS:
+                    session.next_move = self.COMMANDS[command]
+                elif command == 'STATS':
+                    writer.write(self.stats_line().encode())
+                elif command == 'QUIT':
+                    break
+                else:
+                    writer.write(b'ERROR unknown command\n')
+        except ConnectionError:
+            pass
+        except ValueError: # the line is longer than the reader's limit
+            self.__fail_session(session, 'line too long')
+        finally:
+            self.__close_session(session)
+
+    def __fail_session(self, session, error):
+        """Sends the error to the client and closes its session
+
+        """
+        if not session.is_closed:
+            session.writer.write('ERROR {0}\n'.format(error).encode())
+        self.__close_session(session)
+
+    def __close_session(self, session):
+        """Removes the session and closes its connection
+
+        """
+        if not session.is_closed:
+            session.is_closed = True
+            self.sessions.pop(session.session_id, None)
+            session.writer.close()
+
+
+async def serve(host, port, tick_interval):
+    """Runs the server until it is cancelled
+
+    """
+    server = GameServer(tick_interval=tick_interval)
+    port = await server.start(host, port)
+    print('Serving on {0}:{1}'.format(host, port))
+    try:
+        await asyncio.Future()
+    finally:
+        await server.close()
+
+def main():
+    """Main entry point
+
+    """
+    parser = argparse.ArgumentParser(description='Snake game server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--tick', type=float, default=GAME_SPEED,
+        help='seconds between two game ticks')
+    arguments = parser.parse_args()
+    try:
+        asyncio.run(serve(arguments.host, arguments.port, arguments.tick))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,17 @@
-import unittest
+import asyncio, io, os, random, tempfile, threading, unittest
+import pygame
 from snakecore import *
-from snakegui import transform
+from snakegui import transform, TextCache, AssetManager
+from snakeserver import GameServer
+from snakevalidate import validate_files
+from snakeconsole import TerminalRenderer, PosixKeyboard, msvcrt,\
+    KEY_UP, KEY_DOWN, KEY_ESCAPE
 from constants import *
+try:
+    from snakebatch import LevelBatch, ObservationEncoder,\
+        encode_observations
+except ImportError:
+    LevelBatch = None
 
 class TestLevelManager(unittest.TestCase):
     """Tests of the LevelManager class
@@ -55,6 +65,201 @@ class TestLevelManager(unittest.TestCase):
         self.assertRaises(LevelFormatError, manager.load_next_level)
         #snake is too short
         self.assertRaises(LevelFormatError, manager.load_next_level)
+        #brick is out of the maze
+        self.assertRaises(LevelFormatError, manager.load_next_level)
+
+
+class TestLevelCache(unittest.TestCase):
+    """Tests of the LevelCache class
+
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = []
+        for i in range(3):
+            path = os.path.join(self.directory.name, '{0}.level'.format(i))
+            open(path, 'w').close()
+            self.paths.append(path)
+        self.loaded = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, path):
+        self.loaded.append(path)
+        return Level(len(self.loaded))
+
+    def test_cached_level(self):
+        """Testing that the level is loaded only once
+
+        """
+        cache = LevelCache()
+        first = cache.get(self.paths[0], self.load)
+        second = cache.get(self.paths[0], self.load)
+        self.assertIs(first, second)
+        self.assertEqual(self.loaded, [self.paths[0]])
+
+    def test_modified_level(self):
+        """Testing that the level is loaded again after modification
+
+        """
+        cache = LevelCache()
+        cache.get(self.paths[0], self.load)
+        stat = os.stat(self.paths[0])
+        os.utime(self.paths[0],
+            ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        cache.get(self.paths[0], self.load)
+        self.assertEqual(self.loaded, [self.paths[0]] * 2)
+
+    def test_cache_size(self):
+        """Testing that the least recently used level is removed
+
+        """
+        cache = LevelCache(2)
+        cache.get(self.paths[0], self.load)
+        cache.get(self.paths[1], self.load)
+        cache.get(self.paths[0], self.load)
+        cache.get(self.paths[2], self.load)
+        cache.get(self.paths[0], self.load)
+        cache.get(self.paths[1], self.load)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(self.loaded, [self.paths[0], self.paths[1],
+                                       self.paths[2], self.paths[1]])
+
+    def test_fresh_level_copies(self):
+        """Testing that the manager returns independent levels
+
+        """
+        manager = LevelManager('testdata/correctlevels')
+        first_level = manager.load_next_level()
+        manager.reset()
+        second_level = manager.current_level
+        self.assertIsNot(first_level, second_level)
+        first_level.move(GameMoves.PASS)
+        self.assertEqual(second_level.snake,
+            [(1, 8), (1, 7), (1, 6), (1, 5), (1, 4), (1, 3)])
+
+
+class TestCompiledLevels(unittest.TestCase):
+    """Tests of the compiled level format
+
+    """
+    def test_encode_decode(self):
+        """Testing that compiled level is the same as the text level
+
+        """
+        manager = LevelManager('testdata/correctlevels')
+        level = manager.read_level('testdata/correctlevels/2.level', 2)
+        compiled = decode_level(encode_level(level), 2)
+        self.assertEqual(compiled.level, 2)
+        self.assertEqual(compiled.snake_max_length, 10)
+        self.assertEqual(compiled.maze_width, 10)
+        self.assertEqual(compiled.maze_height, 10)
+        self.assertEqual(compiled.snake_direction, (0, -1))
+        self.assertEqual(compiled.snake,
+            [(3, 2), (3, 3), (3, 4), (4, 4), (5, 4)])
+        self.assertEqual(compiled.barrier, [(1, 4), (6, 4)])
+
+    def test_compiled_levels_loading(self):
+        """Testing loading of compiled levels from the level directory
+
+        """
+        manager = LevelManager('testdata/correctlevels')
+        with tempfile.TemporaryDirectory() as directory:
+            for number in (1, 2):
+                level = manager.read_level(
+                    'testdata/correctlevels/{0}.level'.format(number))
+                filename = os.path.join(directory,
+                    str(number) + COMPILED_LEVEL_EXTENSION)
+                with open(filename, 'wb') as file:
+                    file.write(encode_level(level))
+            compiled_manager = LevelManager(directory)
+            first_level = compiled_manager.load_next_level()
+            second_level = compiled_manager.load_next_level()
+            self.assertRaises(LastLevelError,
+                              compiled_manager.load_next_level)
+        self.assertEqual(first_level.snake,
+            [(1, 8), (1, 7), (1, 6), (1, 5), (1, 4), (1, 3)])
+        self.assertEqual(second_level.barrier, [(1, 4), (6, 4)])
+
+    def test_modified_text_level(self):
+        """Testing that the text level is loaded if it is modified after
+        the level is compiled
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            text_filename = os.path.join(directory, '1' + LEVEL_EXTENSION)
+            with open('testdata/correctlevels/1.level') as file:
+                text = file.read()
+            with open(text_filename, 'w') as file:
+                file.write(text)
+            manager = LevelManager(directory)
+            level = manager.read_level(text_filename)
+            level.snake_max_length = 20
+            compiled_filename = os.path.join(directory,
+                                             '1' + COMPILED_LEVEL_EXTENSION)
+            with open(compiled_filename, 'wb') as file:
+                file.write(encode_level(level))
+            os.utime(text_filename, ns=(0, 0))
+            self.assertEqual(manager.load_next_level().snake_max_length, 20)
+            with open(text_filename, 'w') as file:
+                file.write(text.replace('snake max length: 15',
+                                        'snake max length: 99'))
+            os.utime(compiled_filename, ns=(0, 0))
+            manager.reset()
+            self.assertEqual(manager.current_level.snake_max_length, 99)
+
+    def test_level_pack_loading(self):
+        """Testing loading of levels from level pack
+
+        """
+        manager = LevelManager('testdata/correctlevels')
+        levels = [manager.read_level(
+            'testdata/correctlevels/{0}.level'.format(number), number)
+            for number in (1, 2)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'all' + LEVEL_PACK_EXTENSION)
+            LevelPack.write(filename, levels)
+            pack_manager = LevelManager(filename)
+            self.assertEqual(pack_manager.level_count, 2)
+            first_level = pack_manager.load_next_level()
+            second_level = pack_manager.load_next_level()
+            self.assertRaises(LastLevelError, pack_manager.load_next_level)
+        self.assertEqual(first_level.level, 1)
+        self.assertEqual(first_level.barrier,
+            [(1, 14), (2, 14), (3, 15), (3, 16), (3, 17), (3, 18), (3, 19)])
+        self.assertEqual(second_level.level, 2)
+        self.assertEqual(second_level.snake,
+            [(3, 2), (3, 3), (3, 4), (4, 4), (5, 4)])
+
+    def test_rewritten_level_pack(self):
+        """Testing that the level pack is opened again when the file
+        is rewritten
+
+        """
+        manager = LevelManager('testdata/correctlevels')
+        levels = [manager.read_level(
+            'testdata/correctlevels/{0}.level'.format(number), number)
+            for number in (1, 2)]
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'all' + LEVEL_PACK_EXTENSION)
+            LevelPack.write(filename, levels)
+            os.utime(filename, ns=(0, 0))
+            pack_manager = LevelManager(filename)
+            self.assertEqual(pack_manager.level_count, 2)
+            LevelPack.write(filename, levels[1:])
+            self.assertEqual(pack_manager.level_count, 1)
+            level = pack_manager.load_next_level()
+            self.assertRaises(LastLevelError, pack_manager.load_next_level)
+        self.assertEqual(level.snake,
+            [(3, 2), (3, 3), (3, 4), (4, 4), (5, 4)])
+
+    def test_incorrect_compiled_level(self):
+        """Testing decoding of data which is not compiled level
+
+        """
+        self.assertRaises(LevelFormatError, decode_level, b'SNKL')
+        self.assertRaises(LevelFormatError, decode_level, b'x' * 64)
 
 
 class DummyLevelManager:
@@ -189,6 +394,770 @@ class TestGame(unittest.TestCase):
         state= game.move(GameMoves.UP)
         self.assertEqual(state, LevelState.LOSE)
 
+    def test_seeded_games(self):
+        """Testing that games with the same seed place the apples
+        on the same positions
+
+        """
+        games = [Game(LevelManager('testdata/correctlevels'), seed=42)
+                 for i in range(2)]
+        self.assertEqual(games[0].current_level.apple,
+                         games[1].current_level.apple)
+        for game in games:
+            game.current_level.move_apple()
+        self.assertEqual(games[0].current_level.apple,
+                         games[1].current_level.apple)
+
+    def test_save_and_load(self):
+        """Testing that the loaded game continues as the saved one
+
+        """
+        game = Game(LevelManager('testdata/correctlevels'), seed=1)
+        game.move(GameMoves.UP)
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.sav')
+            game.save(filename)
+            loaded_game = Game.load_game_from_file(filename)
+        self.assertEqual(loaded_game.snapshot(), game.snapshot())
+        for move in (GameMoves.LEFT, GameMoves.DOWN, GameMoves.PASS):
+            self.assertEqual(loaded_game.move(move), game.move(move))
+            self.assertEqual(loaded_game.current_level.apple,
+                             game.current_level.apple)
+
+    def test_changed_level_loading(self):
+        """Testing loading of a game whose level is changed
+
+        """
+        game = Game(LevelManager('testdata/correctlevels'))
+        snapshot = game.snapshot()._replace(barrier_hash=bytes(16))
+        self.assertRaises(SaveFormatError, Game.from_snapshot, snapshot)
+        self.assertRaises(SaveFormatError, decode_snapshot, b'SNKS')
+
+    def test_journal_recovery(self):
+        """Testing restoring of a game from its checkpoint and log
+
+        """
+        game = Game(LevelManager('testdata/correctlevels'), seed=2)
+        moves = [GameMoves.PASS, GameMoves.DOWN, GameMoves.LEFT,
+                 GameMoves.UP, GameMoves.RIGHT] * 5
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'journal.sav')
+            game.start_journal(filename, checkpoint_interval=7)
+            for move in moves:
+                game.move(move)
+            game.journal.flush()
+            recovered_game = Game.recover(filename)
+            self.assertEqual(recovered_game.snapshot(), game.snapshot())
+            game.save(filename)
+            game.move(GameMoves.PASS)
+            game.stop_journal()
+            recovered_game = Game.recover(filename)
+            self.assertEqual(recovered_game.current_level.snake_length,
+                             game.current_level.snake_length)
+            self.assertNotEqual(recovered_game.current_level.snake,
+                                game.current_level.snake)
+
+    def test_auto_saver(self):
+        """Testing saving of games on the background thread
+
+        """
+        game = Game(LevelManager('testdata/correctlevels'), seed=3)
+        saver = AutoSaver()
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'auto.sav')
+            for move in (GameMoves.PASS, GameMoves.UP, GameMoves.LEFT):
+                game.move(move)
+                saver.save(game, filename)
+            saver.wait()
+            loaded_game = Game.load_game_from_file(filename)
+            saver.close()
+        self.assertEqual(loaded_game.snapshot(), game.snapshot())
+        self.assertEqual(saver.saves + saver.coalesced, 3)
+        self.assertIsNone(saver.last_error)
+        self.assertGreater(saver.last_save_duration, 0)
+
+    def test_auto_saver_error(self):
+        """Testing that the error of a failed background save is kept
+        until it is read even when a later save succeeds
+
+        """
+        game = Game(LevelManager('testdata/correctlevels'), seed=3)
+        saver = AutoSaver()
+        with tempfile.TemporaryDirectory() as directory:
+            missing = os.path.join(directory, 'missing', 'auto.sav')
+            saver.save(game, missing)
+            saver.wait()
+            saver.save(game, os.path.join(directory, 'auto.sav'))
+            saver.close()
+        self.assertIsInstance(saver.pop_error(), IOError)
+        self.assertIsNone(saver.pop_error())
+
+    def test_legacy_save_loading(self):
+        """Testing that the saves created by older versions of the game
+        could be loaded and played
+
+        """
+        game = Game.load_game_from_file('saves/test.sav')
+        self.assertEqual(game.current_level.level, 1)
+        state = game.move(GameMoves.PASS)
+        self.assertEqual(state, LevelState.RUNNING)
+        self.assertEqual(game.current_level.snake_length, 7)
+
+class TestReplay(unittest.TestCase):
+    """Tests of the replay recording and playback
+
+    """
+    def setUp(self):
+        self.game = Game(LevelManager('testdata/correctlevels'), seed=4)
+        self.game.start_recording(keyframe_interval=4)
+        self.snapshots = [self.game.snapshot()]
+        moves = [GameMoves.PASS, GameMoves.DOWN, GameMoves.LEFT,
+                 GameMoves.UP, GameMoves.PASS, GameMoves.RIGHT] * 3
+        for move in moves:
+            self.game.move(move)
+            self.snapshots.append(self.game.snapshot())
+        self.replay = self.game.stop_recording()
+
+    def test_seek(self):
+        """Testing seeking forward and backward in the replay
+
+        """
+        player = ReplayPlayer(self.replay)
+        for tick in (0, 17, 5, 6, 18, 3, 9):
+            player.seek(tick)
+            self.assertEqual(player.game.snapshot(), self.snapshots[tick])
+        self.assertFalse(player.is_finished)
+
+    def test_playback(self):
+        """Testing playing of saved replay to its end
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, 'test.replay')
+            self.replay.save(filename)
+            player = ReplayPlayer(Replay.load(filename))
+        while not player.is_finished:
+            player.step(5)
+        self.assertEqual(player.tick, 18)
+        self.assertEqual(player.game.snapshot(), self.snapshots[-1])
+
+
+class TestSnakeBody(unittest.TestCase):
+    """Tests of the SnakeBody class
+
+    """
+    def test_head_and_tail_moves(self):
+        """Testing moving of the head and the tail of the snake
+
+        """
+        body = SnakeBody([(1, 2), (1, 1)])
+        body.push_head((1, 3))
+        self.assertEqual(body.head, (1, 3))
+        self.assertEqual(body.pop_tail(), (1, 1))
+        self.assertEqual(body, [(1, 3), (1, 2)])
+        self.assertEqual(len(body), 2)
+
+    def test_membership(self):
+        """Testing checking if a block is part of the snake
+
+        """
+        body = SnakeBody([(1, 2), (1, 1)])
+        self.assertIn((1, 1), body)
+        body.pop_tail()
+        self.assertNotIn((1, 1), body)
+        body.push_head((1, 2))
+        body.pop_tail()
+        self.assertIn((1, 2), body)
+
+
+class TestLevel(unittest.TestCase):
+    """Tests of the Level class
+
+    """
+    def test_apple_placement(self):
+        """Testing that the apple is placed only on free cells
+
+        """
+        level = Level(0)
+        level.maze_width = 3
+        level.maze_height = 2
+        level.snake = [(0, 1), (0, 0)]
+        level.barrier = [(1, 0), (1, 1), (1, 2)]
+        for i in range(10):
+            self.assertTrue(level.move_apple())
+            self.assertEqual(level.apple, (0, 2))
+
+    def test_level_problems(self):
+        """Testing the search for problems which make the level
+        impossible to be finished
+
+        """
+        level = Level(0)
+        level.snake_max_length = 4
+        level.maze_width = 5
+        level.maze_height = 1
+        level.snake = [(0, 1), (0, 0)]
+        level.barrier = [(0, 2)]
+        self.assertEqual(level.find_problems(),
+            ['2 apple positions are unreachable'])
+        level.barrier = []
+        self.assertEqual(level.find_problems(), [])
+        level.snake_max_length = 6
+        self.assertEqual(level.find_problems(),
+            ['The maze is too small for snake max length'])
+
+    def test_validate_files(self):
+        """Testing that a level which is not valid text is reported as
+        an invalid file without stopping the validation of the others
+
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            valid = os.path.join(directory, '1.level')
+            with open('testdata/correctlevels/1.level', 'rb') as source:
+                data = source.read()
+            with open(valid, 'wb') as file:
+                file.write(data)
+            broken = os.path.join(directory, '2.level')
+            with open(broken, 'wb') as file:
+                file.write(b'\xff\xfe')
+            results = sorted(validate_files([broken, valid], 2),
+                             key=lambda result: result['file'])
+        self.assertEqual([result['file'] for result in results],
+                         [valid, broken])
+        self.assertTrue(results[0]['valid'])
+        self.assertFalse(results[1]['valid'])
+
+    def test_full_maze(self):
+        """Testing the level state when there is no place for the apple
+
+        """
+        level = Level(0)
+        level.snake_max_length = 10
+        level.maze_width = 3
+        level.maze_height = 1
+        level.snake = [(0, 1), (0, 0)]
+        level.snake_direction = (0, 1)
+        level.apple = (0, 2)
+        state = level.move(GameMoves.PASS)
+        self.assertEqual(state, LevelState.FULL)
+        self.assertEqual(level.apple, None)
+
+
+@unittest.skipIf(LevelBatch is None, 'NumPy is not installed')
+class TestLevelBatch(unittest.TestCase):
+    """Tests of the LevelBatch class
+
+    """
+    def setUp(self):
+        manager = DummyLevelManager()
+        manager.load_next_level()
+        self.level = manager.current_level
+
+    def test_moves(self):
+        """Testing moving of different games in the same batch
+
+        """
+        batch = LevelBatch(self.level, 3)
+        states = batch.move([GameMoves.UP, GameMoves.DOWN, GameMoves.LEFT])
+        self.assertEqual(list(states), [LevelState.RUNNING] * 3)
+        self.assertEqual(batch.snake(0),
+            [(0, 8), (1, 8), (1, 7), (1, 6), (1, 5), (1, 4)])
+        self.assertEqual(batch.snake(1),
+            [(2, 8), (1, 8), (1, 7), (1, 6), (1, 5), (1, 4)])
+        self.assertEqual(batch.snake(2),
+            [(1, 9), (1, 8), (1, 7), (1, 6), (1, 5), (1, 4)])
+
+    def test_apple_and_colisions(self):
+        """Testing taking of the apple and the colisions in one batch
+
+        """
+        batch = LevelBatch(self.level, 3)
+        batch.move(GameMoves.PASS)
+        states = batch.move([GameMoves.UP, GameMoves.PASS, GameMoves.DOWN])
+        self.assertEqual(list(states),
+            [LevelState.RUNNING, LevelState.LOSE, LevelState.RUNNING])
+        self.assertEqual(list(batch.snake_length), [7, 6, 6])
+        self.assertNotEqual(batch.apple_position(0), (0, 9))
+        states = batch.move([GameMoves.PASS, GameMoves.PASS, GameMoves.LEFT])
+        self.assertEqual(list(states),
+            [LevelState.LOSE, LevelState.LOSE, LevelState.RUNNING])
+
+    def test_win(self):
+        """Testing that the game is won when the snake is long enough
+
+        """
+        self.level.snake_max_length = 7
+        batch = LevelBatch(self.level, 1)
+        batch.move(GameMoves.PASS)
+        states = batch.move(GameMoves.UP)
+        self.assertEqual(list(states), [LevelState.WIN])
+
+
+class TestGameServer(unittest.TestCase):
+    """Testing the game server over the loopback interface
+
+    """
+    def play(self, commands, ticks):
+        """Connects a client, sends the commands and reads the state lines
+        of the given number of ticks. Returns the received lines
+
+        """
+        async def client():
+            server = GameServer('testdata/correctlevels', tick_interval=0.01,
+                                resolution=0.005)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                               port)
+                lines = [await reader.readline()]
+                for command in commands:
+                    writer.write(command.encode() + b'\n')
+                lines += [await reader.readline() for i in range(ticks)]
+                writer.write(b'STATS\n')
+                line = await reader.readline()
+                while not line.startswith(b'STATS'):
+                    line = await reader.readline()
+                lines.append(line)
+                writer.close()
+                return [line.decode().split() for line in lines]
+            finally:
+                await server.close()
+        return asyncio.run(asyncio.wait_for(client(), 10))
+
+    def test_ticks(self):
+        """Testing the state lines of one session
+
+        """
+        lines = self.play(['DOWN'], 2)
+        self.assertEqual(lines[0], ['HELLO', '1'])
+        self.assertEqual([line[:2] for line in lines[1:3]],
+                         [['TICK', '1'], ['TICK', '2']])
+        self.assertEqual(lines[1][2], str(LevelState.RUNNING))
+        stats = lines[3]
+        self.assertEqual(stats[:2], ['STATS', '1'])
+        self.assertGreaterEqual(int(stats[2]), 2)
+        self.assertGreaterEqual(float(stats[5]), 0.0)
+
+    def test_level_error(self):
+        """Testing that the client receives an error when its game could
+        not be started
+
+        """
+        async def client():
+            server = GameServer('testdata/nolevels', tick_interval=0.01,
+                                resolution=0.005)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                               port)
+                lines = [await reader.readline(), await reader.readline()]
+                writer.close()
+                return lines
+            finally:
+                await server.close()
+        lines = asyncio.run(asyncio.wait_for(client(), 10))
+        self.assertTrue(lines[0].startswith(b'ERROR '))
+        self.assertEqual(lines[1], b'')
+
+    def test_long_line(self):
+        """Testing that a line longer than the reader's limit closes
+        the session with an error
+
+        """
+        async def client():
+            errors = []
+            loop = asyncio.get_running_loop()
+            loop.set_exception_handler(
+                lambda loop, context: errors.append(context))
+            server = GameServer('testdata/correctlevels', tick_interval=0.01,
+                                resolution=0.005)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                               port)
+                writer.write(b'A' * 70000 + b'\n')
+                lines = [await reader.readline()]
+                while lines[-1]:
+                    lines.append(await reader.readline())
+                writer.close()
+                return lines, errors
+            finally:
+                await server.close()
+        lines, errors = asyncio.run(asyncio.wait_for(client(), 10))
+        self.assertEqual(lines[-2:], [b'ERROR line too long\n', b''])
+        self.assertEqual(errors, [])
+
+    def test_move_error(self):
+        """Testing that a failing game closes only its own session
+
+        """
+        async def client():
+            server = GameServer('testdata/correctlevels', tick_interval=0.01,
+                                resolution=0.005)
+            port = await server.start('127.0.0.1', 0)
+            try:
+                connections = [await asyncio.open_connection('127.0.0.1',
+                                                             port)
+                               for i in range(2)]
+                for reader, writer in connections:
+                    await reader.readline()
+                def move(game_move):
+                    raise IOError('broken level')
+                server.sessions[1].game.move = move
+                broken, working = [reader for reader, writer in connections]
+                broken_lines = [await broken.readline()]
+                while broken_lines[-1]:
+                    broken_lines.append(await broken.readline())
+                working_lines = [await working.readline() for i in range(3)]
+                for reader, writer in connections:
+                    writer.close()
+                return broken_lines, working_lines
+            finally:
+                await server.close()
+        broken_lines, working_lines = asyncio.run(
+            asyncio.wait_for(client(), 10))
+        self.assertEqual(broken_lines[-2:], [b'ERROR broken level\n', b''])
+        self.assertTrue(all(line.startswith(b'TICK ')
+                            for line in working_lines))
+
+
+class TestArenaLevel(unittest.TestCase):
+    """Testing the arena with many snakes
+
+    """
+    def setUp(self):
+        manager = LevelManager('testdata/arenalevels')
+        self.arena = manager.read_arena('testdata/arenalevels/1.level')
+        self.arena.apple = (0, 9)
+
+    def test_read_arena(self):
+        """Testing that all the snakes are read
+
+        """
+        self.assertEqual(self.arena.snakes,
+                         [[(1, 3), (1, 2), (1, 1)],
+                          [(3, 5), (3, 6), (3, 7)],
+                          [(5, 4), (5, 3), (5, 2)]])
+        self.assertEqual(self.arena.snake_directions,
+                         [(0, 1), (0, -1), (0, 1)])
+        self.assertEqual(self.arena.owner((3, 7)), 1)
+        self.assertEqual(self.arena.owner((0, 0)), None)
+
+    def test_head_collision(self):
+        """Testing that two snakes moving into the same cell lose
+
+        """
+        self.arena.move([GameMoves.DOWN, GameMoves.PASS, GameMoves.PASS])
+        states = self.arena.move([GameMoves.PASS] * 3)
+        self.assertEqual(states, [LevelState.LOSE, LevelState.LOSE,
+                                  LevelState.RUNNING])
+        self.assertEqual(self.arena.running_count, 1)
+        self.assertEqual(self.arena.owner((2, 3)), None)
+        self.assertEqual(self.arena.owner((3, 4)), None)
+
+    def test_body_collision(self):
+        """Testing that a snake moving into other snake's body loses
+
+        """
+        self.arena.move([GameMoves.PASS, GameMoves.PASS, GameMoves.UP])
+        states = self.arena.move([GameMoves.PASS] * 3)
+        self.assertEqual(states, [LevelState.RUNNING, LevelState.RUNNING,
+                                  LevelState.LOSE])
+        self.assertEqual(self.arena.owner((3, 4)), 1)
+
+    def test_eat_apple(self):
+        """Testing that the snake which eats the apple grows and wins
+
+        """
+        self.arena.apple = (1, 4)
+        self.arena.move([GameMoves.PASS] * 3)
+        self.assertEqual(self.arena.snakes[0],
+                         [(1, 4), (1, 3), (1, 2), (1, 1)])
+        self.assertNotEqual(self.arena.apple, (1, 4))
+        self.arena.snake_max_length = 5
+        self.arena.apple = (1, 5)
+        states = self.arena.move([GameMoves.PASS] * 3)
+        self.assertEqual(states[0], LevelState.WIN)
+        self.assertEqual(self.arena.owner((1, 5)), None)
+
+
+class TestLevelMirror(unittest.TestCase):
+    """Testing the level mirror kept in sync with deltas
+
+    """
+    def test_mirror(self):
+        """Testing that the mirror follows the moved level when the
+        deltas are fed in small pieces
+
+        """
+        manager = LevelManager('testdata/correctlevels', random.Random(5))
+        level = manager.load_next_level()
+        mirror = LevelMirror(encode_level_snapshot(level))
+        moves = [GameMoves.PASS, GameMoves.DOWN, GameMoves.PASS,
+                 GameMoves.LEFT, GameMoves.PASS, GameMoves.UP]
+        deltas = []
+        for game_move in moves:
+            level.move(game_move, deltas)
+        data = b''.join(encode_delta(delta) for delta in deltas)
+        for i in range(0, len(data), 3):
+            mirror.feed(data[i:i + 3])
+        self.assertEqual(mirror.deltas, len(moves))
+        self.assertEqual(mirror.state, deltas[-1].state)
+        self.assertEqual(mirror.level.snake, level.snake)
+        self.assertEqual(mirror.level.apple, level.apple)
+        self.assertEqual(mirror.level.snake_direction, level.snake_direction)
+
+    def test_delta(self):
+        """Testing the delta of a move which eats the apple
+
+        """
+        level = Level(0)
+        level.snake_max_length = 5
+        level.maze_width = 4
+        level.maze_height = 1
+        level.snake = [(0, 1), (0, 0)]
+        level.snake_direction = (0, 1)
+        level.apple = (0, 2)
+        deltas = []
+        level.move(GameMoves.PASS, deltas)
+        self.assertEqual(deltas, [LevelDelta(LevelState.RUNNING, (0, 2),
+                                             None, (0, 3))])
+        data = encode_delta(deltas[0])
+        self.assertEqual(len(data), 9)
+        self.assertEqual(decode_delta(data), (deltas[0], 9))
+        self.assertEqual(decode_delta(data[:8]), None)
+
+
+class TestInputBuffer(unittest.TestCase):
+    """Testing the buffer of the player's moves
+
+    """
+    def test_queued_turns(self):
+        """Testing that two quick turns are taken on two ticks
+
+        """
+        buffer = InputBuffer(3)
+        self.assertTrue(buffer.push(GameMoves.UP, (0, 1)))
+        self.assertTrue(buffer.push(GameMoves.LEFT, (0, 1)))
+        self.assertEqual(buffer.depth, 2)
+        self.assertEqual(buffer.pop(), GameMoves.UP)
+        self.assertEqual(buffer.pop(), GameMoves.LEFT)
+        self.assertEqual(buffer.pop(), GameMoves.PASS)
+
+    def test_dropped_moves(self):
+        """Testing that the redundant, the reversing and the moves over
+        the limit are dropped
+
+        """
+        buffer = InputBuffer(2)
+        self.assertFalse(buffer.push(GameMoves.RIGHT, (0, 1)))
+        self.assertFalse(buffer.push(GameMoves.LEFT, (0, 1)))
+        buffer.push(GameMoves.DOWN, (0, 1))
+        self.assertFalse(buffer.push(GameMoves.UP, (0, 1)))
+        buffer.push(GameMoves.LEFT, (0, 1))
+        self.assertFalse(buffer.push(GameMoves.DOWN, (0, 1)))
+        self.assertEqual(buffer.depth, 2)
+        self.assertEqual(buffer.dropped, 4)
+
+
+class CountingFont:
+    """Font which counts the rendered texts
+
+    """
+    def __init__(self):
+        self.renders = 0
+
+    def render(self, text, antialias, color):
+        self.renders += 1
+        return (text, color)
+
+
+class TestTextCache(unittest.TestCase):
+    """Testing the cache of the rendered texts
+
+    """
+    def test_render_once(self):
+        """Testing that the same text is rendered only once
+
+        """
+        cache = TextCache(2)
+        text_font = CountingFont()
+        for i in range(3):
+            surface = cache.render(text_font, 'LOAD', False, (0, 0, 0))
+        self.assertEqual(surface, ('LOAD', (0, 0, 0)))
+        self.assertEqual(text_font.renders, 1)
+        cache.render(text_font, 'LOAD', False, (255, 0, 0))
+        self.assertEqual(text_font.renders, 2)
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+
+    def test_eviction(self):
+        """Testing that the least recently used text is removed
+
+        """
+        cache = TextCache(2)
+        text_font = CountingFont()
+        cache.render(text_font, 'START', False, (0, 0, 0))
+        cache.render(text_font, 'LOAD', False, (0, 0, 0))
+        cache.render(text_font, 'START', False, (0, 0, 0))
+        cache.render(text_font, 'EXIT', False, (0, 0, 0))
+        self.assertEqual(len(cache), 2)
+        cache.render(text_font, 'START', False, (0, 0, 0))
+        self.assertEqual(text_font.renders, 3)
+        cache.render(text_font, 'LOAD', False, (0, 0, 0))
+        self.assertEqual(text_font.renders, 4)
+
+    def test_shared_fonts(self):
+        """Testing that the same font object is returned for each size,
+        so the UI states created later reuse the cached texts
+
+        """
+        pygame.font.init()
+        assets = AssetManager()
+        self.assertIs(assets.font(50), assets.font(50))
+        self.assertIsNot(assets.font(50), assets.font(23))
+
+
+class TestTerminalRenderer(unittest.TestCase):
+    """Testing the incremental console renderer
+
+    """
+    def setUp(self):
+        self.level = Level(1)
+        self.level.snake_max_length = 5
+        self.level.maze_width = 4
+        self.level.maze_height = 2
+        self.level.snake = [(0, 1), (0, 0)]
+        self.level.snake_direction = (0, 1)
+        self.level.barrier = [(1, 3)]
+        self.level.apple = (1, 0)
+        self.output = io.StringIO()
+        self.renderer = TerminalRenderer(self.output)
+
+    def test_draw(self):
+        """Testing that the whole maze is drawn
+
+        """
+        self.renderer.draw(self.level)
+        self.assertTrue(self.output.getvalue().endswith(
+            'oo--\nX--#\n\nLevel: 1 Snake Length: 2/5'))
+
+    def test_update(self):
+        """Testing that only the head and the tail are written after
+        a move
+
+        """
+        self.renderer.draw(self.level)
+        self.output.seek(0)
+        self.output.truncate()
+        deltas = []
+        self.level.move(GameMoves.PASS, deltas)
+        self.renderer.update(self.level, deltas)
+        self.assertEqual(sorted(self.output.getvalue().split('\x1b')),
+                         ['', '[1;1H-', '[1;3Ho'])
+
+
+@unittest.skipIf(msvcrt is not None, 'The terminal is not POSIX')
+class TestPosixKeyboard(unittest.TestCase):
+    """Testing the parsing of the keys read from the terminal
+
+    """
+    def setUp(self):
+        self.read_fd, self.write_fd = os.pipe()
+        self.keyboard = PosixKeyboard(self.read_fd)
+
+    def tearDown(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+    def test_keys(self):
+        """Testing the arrows, the escape and the plain keys
+
+        """
+        os.write(self.write_fd, b'\x1b[As\x1b')
+        self.assertEqual(self.keyboard.read_keys(),
+                         [KEY_UP, 's', KEY_ESCAPE])
+
+    def test_split_sequence(self):
+        """Testing an arrow whose escape sequence is split between
+        two reads
+
+        """
+        os.write(self.write_fd, b's\x1b[')
+        self.assertEqual(self.keyboard.read_keys(), ['s'])
+        os.write(self.write_fd, b'A')
+        self.assertEqual(self.keyboard.read_keys(), [KEY_UP])
+
+    def test_split_escape(self):
+        """Testing an arrow which is split right after the escape and
+        an escape which is not followed by more data
+
+        """
+        os.write(self.write_fd, b'\x1b')
+        writer = threading.Timer(CONSOLE_ESCAPE_TIMEOUT / 5,
+                                 os.write, (self.write_fd, b'[B'))
+        writer.start()
+        self.assertEqual(self.keyboard.read_keys(), [KEY_DOWN])
+        writer.join()
+        os.write(self.write_fd, b'\x1b')
+        self.assertEqual(self.keyboard.read_keys(), [KEY_ESCAPE])
+
+
+@unittest.skipIf(LevelBatch is None, 'NumPy is not installed')
+class TestObservations(unittest.TestCase):
+    """Testing the encoding of the levels as arrays
+
+    """
+    def setUp(self):
+        manager = DummyLevelManager()
+        manager.load_next_level()
+        self.level = manager.current_level
+
+    def test_encode(self):
+        """Testing the channels of an encoded level
+
+        """
+        observation = encode_observations([self.level])[0]
+        self.assertEqual(observation.shape, (4, 8, 23))
+        self.assertEqual(observation[0].sum(), 7)
+        self.assertEqual(observation[1].sum(), 6)
+        self.assertEqual(observation[2, 1, 8], 1)
+        self.assertEqual(observation[2].sum(), 1)
+        self.assertEqual(observation[3, 0, 9], 1)
+        self.assertEqual(observation[3].sum(), 1)
+
+    def test_incremental_update(self):
+        """Testing that the updated observation is the same as the
+        encoding of the moved level
+
+        """
+        encoder = ObservationEncoder(self.level)
+        observation = encoder.observation
+        self.level.rng = random.Random(6)
+        for game_move in [GameMoves.PASS, GameMoves.UP, GameMoves.LEFT,
+                          GameMoves.LEFT, GameMoves.DOWN]:
+            deltas = []
+            self.level.move(game_move, deltas)
+            encoder.update(self.level, deltas)
+            self.assertIs(encoder.observation, observation)
+            self.assertTrue((observation ==
+                             encode_observations([self.level])[0]).all())
+
+    def test_batch(self):
+        """Testing the observations of a LevelBatch
+
+        """
+        batch = LevelBatch(self.level, 2, seed=7)
+        batch.move([GameMoves.UP, GameMoves.PASS])
+        batch.move([GameMoves.PASS, GameMoves.PASS])
+        observations = batch.observations()
+        for game in range(2):
+            level = self.level.copy()
+            level.snake = batch.snake(game)
+            level.apple = batch.apple_position(game)
+            expected = encode_observations([level])[0]
+            self.assertTrue((observations[game] == expected).all())
+
+
 class TestTransformCoordinates(unittest.TestCase):
     """Testing transform function
 
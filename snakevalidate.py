@@ -0,0 +1,112 @@
+"""Validator of Snake Game level files
+
+Usage: python snakevalidate.py [-j <jobs>] [-o <summary>] <path>...
+Each path is a level file or a directory with level files. The levels
+are checked in parallel and the result of each file is printed as soon
+as it is ready. The summary is written as JSON if it is requested.
+
+"""
+
+import argparse, glob, json, os, sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from snakecore import *
+
+def validate_file(filename):
+    """Loads the level file with the same rules used by the game and
+    checks if it could be played. Returns dictionary with the file name,
+    the validation status and the found errors.
+
+    filename - the path of the level file
+
+    """
+    try:
+        name = os.path.basename(filename)
+        number = name[:name.index('.')] if '.' in name else name
+        number = int(number) if number.isdigit() else 1
+        level = LevelManager(os.path.dirname(filename))\
+            .read_level(filename, number)
+        errors = level.find_problems()
+    except LevelFormatError as ex:
+        errors = ['Incorrect level syntax: "{0}"'.format(ex)]
+    except IOError as ex:
+        errors = ['Unexpected error while reading the level: {0}'.format(ex)]
+    except UnicodeDecodeError as ex:
+        errors = ['The level is not valid UTF-8 text: {0}'.format(ex)]
+    except ValueError as ex:
+        errors = ['Incorrect level data: {0}'.format(ex)]
+    except Exception as ex:
+        # one broken file must not stop the validation of the others
+        errors = ['Unexpected error: {0!r}'.format(ex)]
+    return {'file': filename, 'valid': not errors, 'errors': errors}
+
+def find_level_files(paths):
+    """Returns sorted list with the level files in the paths. In the
+    level directories the compiled levels are skipped if the text level
+    is next to them
+
+    paths - list with level files and level directories
+
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            pattern = os.path.join(path, '**', '*' + LEVEL_EXTENSION)
+            text_files = glob.glob(pattern, recursive=True)
+            files.extend(text_files)
+            pattern = os.path.join(path, '**', '*' + COMPILED_LEVEL_EXTENSION)
+            sources = set(os.path.splitext(name)[0] for name in text_files)
+            files.extend(name for name in glob.glob(pattern, recursive=True)
+                         if os.path.splitext(name)[0] not in sources)
+        else:
+            files.append(path)
+    return sorted(set(files))
+
+def validate_files(files, jobs=None):
+    """Validates the files in process pool. Yields the result of each
+    file when it is ready
+
+    files - list with the paths of the level files
+    jobs - the number of the processes, the number of CPUs by default
+
+    """
+    with ProcessPoolExecutor(jobs) as executor:
+        futures = [executor.submit(validate_file, filename)
+                   for filename in files]
+        for future in as_completed(futures):
+            yield future.result()
+
+def main():
+    """Main entry point
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Validates Snake Game level files')
+    parser.add_argument('paths', nargs='+',
+        help='level files or directories with level files')
+    parser.add_argument('-j', '--jobs', type=int,
+        help='number of worker processes')
+    parser.add_argument('-o', '--output',
+        help='file where the JSON summary is written')
+    arguments = parser.parse_args()
+    results = []
+    for result in validate_files(find_level_files(arguments.paths),
+                                 arguments.jobs):
+        results.append(result)
+        if result['valid']:
+            print('OK    {0}'.format(result['file']))
+        else:
+            for error in result['errors']:
+                print('ERROR {0}: {1}'.format(result['file'], error))
+        sys.stdout.flush()
+    results.sort(key=lambda result: result['file'])
+    invalid = sum(1 for result in results if not result['valid'])
+    summary = {'files': len(results), 'valid': len(results) - invalid,
+               'invalid': invalid, 'results': results}
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(summary, file, indent=2)
+    print('{0} files checked, {1} invalid'.format(len(results), invalid))
+    return 1 if invalid else 0
+
+if __name__ == '__main__':
+    sys.exit(main())